@@ -68,7 +68,6 @@ class Course:
         self.url = self.base_url + _utils.SIG_URLS["course"] + "?" + _urllib.parse.urlencode(payload)
         
         html = _cache.get_html(url = self.url, use_cache = use_cache) # Getting the html
-        soup = _bs4.BeautifulSoup(html, "lxml")
 
         if "Course/Cycle of Studies nonexistent." in html or "The Organic Unit is not involved in teaching the course/CS." in html:
             if try_recovery:
@@ -84,9 +83,10 @@ class Course:
 
             raise ValueError(f"Course with pv_curso_id {pv_curso_id} and pv_ano_lectivo {pv_ano_lectivo} doesn't exist")
        
+        soup = _bs4.BeautifulSoup(html, "lxml")
         contents = soup.find("div", {"id" : "conteudoinner"})
 
-        self.name = contents.find_all("h1")[1].string
+        self.name = contents.find_all("h1", limit = 2)[1].string
 
         info_box = contents.find("div", {"class" : "caixa-informativa"})
 
@@ -95,10 +95,10 @@ class Course:
 
         for row in info_box.find_all("tr"):
             if "Acronym:" in str(row):
-                self.acronym = row.find_all("td")[1].string
+                self.acronym = row.find_all("td", limit = 2)[1].string
             
             elif "Official Code:" in str(row):
-                self.official_code = row.find_all("td")[1].string
+                self.official_code = row.find_all("td", limit = 2)[1].string
         
         try:
             self.text = contents.find("div", {"class" : "col-md-8 col-sm-6 col-xs-12"}).text
@@ -179,11 +179,12 @@ class Course:
         }
 
         html = self.base_url.replace("/en/", "/pt/") + credentials.get_html(_utils.SIG_URLS["course classes"], payload)
-        soup = _bs4.BeautifulSoup(html, "lxml")
 
         if "Não existem dados para este ano letivo." in html:
             raise ValueError("No classes were available to be parsed")
 
+        soup = _bs4.BeautifulSoup(html, "lxml")
+
         classes_tags = soup.find_all("a", {"class" : "t"})
 
         return {tag.string : self.base_url.replace("/en/", "/pt/") + tag["href"] for tag in classes_tags}
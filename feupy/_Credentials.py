@@ -112,9 +112,13 @@ class Credentials:
 
         work_queue = (url for url in urls if url not in self.cache)
 
-        with _sessions.FuturesSession(max_workers = n_workers) as session:
-            session.cookies.update(self.session.cookies) # Getting the cookies from the object session to this assynchronous session
+        # The requests are made through the object session, which already has the login cookies and keeps the connections to sigarra alive.
+        # requests_futures only enlarges the connection pool of its own session, not of the one it's given, so that is done here
+        if n_workers > _requests.adapters.DEFAULT_POOLSIZE:
+            self.session.mount("https://", _requests.adapters.HTTPAdapter(pool_connections = n_workers, pool_maxsize = n_workers))
 
+        with _sessions.FuturesSession(max_workers = n_workers, session = self.session) as session:
+            
             futures = [session.get(url) for url in work_queue]
 
             for future in futures:
@@ -1,4 +1,5 @@
 import datetime as _datetime
+import operator as _operator
 import re as _re
 import urllib as _urllib
 
@@ -14,6 +15,29 @@ from . import _internal_utils as _utils
 
 __all__ = ["CurricularUnit"]
 
+# Most pages are only read from a small portion of their html, so the parse can be restricted to that portion
+_INNER_STRAINER    = _bs4.SoupStrainer("div", {"id" : "conteudoinner"})
+_REDIRECT_STRAINER = _bs4.SoupStrainer(["meta", "a"])
+_LINKS_STRAINER    = _bs4.SoupStrainer("a")
+
+_UPLOAD_DATE_REGEX = _re.compile(r"(\d{4})/(\d{1,2})/(\d{1,2})") # year/month/day
+_URL_ID_REGEX      = _re.compile(r"pv_ocorrencia_id=(\d+)$")
+
+def _parse_url(url, base_url):
+    """Returns the (pv_ocorrencia_id, base_url) pair of a curricular unit url. If the url is relative, base_url is kept"""
+    matches = _URL_ID_REGEX.findall(url)
+    
+    if len(matches) == 0:
+        raise ValueError(f"from_url() 'url' argument \"{url}\" is not a valid curricular unit url")
+    
+    pv_ocorrencia_id = int(matches[0])
+
+    matches = _utils.FACULTY_REGEX.findall(url)
+    if len(matches) == 1:
+        base_url = f"https://sigarra.up.pt/{matches[0]}/en/"
+    
+    return (pv_ocorrencia_id, base_url)
+
 class CurricularUnit:
     """This class represents a FEUP curricular unit.
 
@@ -102,6 +126,8 @@ class CurricularUnit:
     """
     __slots__ = ["pv_ocorrencia_id", "url", "name", "code", "acronym", "academic_year", "semester", "has_moodle", "is_active", "webpage_url", 
                  "number_of_students", "curricular_years", "ECTS_credits", "regents", "teachers", "text", "base_url"]
+
+    _SLOT_GETTER = _operator.attrgetter(*__slots__) # Returns a tuple with the attributes' values, in slot order
     
     def __init__(self, pv_ocorrencia_id : int, use_cache : bool = True, base_url : str = "https://sigarra.up.pt/feup/en/", try_recovery : bool = True):
 
@@ -110,10 +136,11 @@ class CurricularUnit:
         self.url = self.base_url + _utils.SIG_URLS["curricular unit"] + "?" + _urllib.parse.urlencode({"pv_ocorrencia_id" : str(pv_ocorrencia_id)})
 
         html = _cache.get_html(url = self.url, use_cache = use_cache) # Getting the html
-        soup = _bs4.BeautifulSoup(html, "lxml")
 
-        if soup.find("meta", {"http-equiv" : "Refresh"}) != None:
-            self.url = soup.find("a")["href"]
+        redirection_url = _parse_redirection_url(html)
+
+        if redirection_url != None:
+            self.url = redirection_url
 
             if "/pt/" in self.url:
                 self.url = self.url.replace("/pt/", "/en/") # I want the page in english
@@ -122,7 +149,6 @@ class CurricularUnit:
                 self.url = self.url[:index] + "en/" + self.url[index:]
 
             html = _cache.get_html(url = self.url, use_cache = use_cache) # Getting the html
-            soup = _bs4.BeautifulSoup(html, "lxml")
         
         index = self.url.index(_utils.SIG_URLS["curricular unit"])
         self.base_url = self.url[:index]
@@ -141,9 +167,10 @@ class CurricularUnit:
             
             raise ValueError(f"Curricular unit with pv_ocorrencia_id {pv_ocorrencia_id} doesn't exist")
        
+        soup = _utils.make_soup(html, parse_only = _INNER_STRAINER)
         contents = soup.find("div", {"id" : "conteudoinner"})
 
-        self.name = contents.find_all("h1")[1].string.strip()
+        self.name = contents.find_all("h1", limit = 2)[1].string.strip()
 
         first_table = contents.find("table")
         self._parse_first_table(first_table)
@@ -168,8 +195,10 @@ class CurricularUnit:
 
 
     def _parse_first_table(self, first_table) -> None:
-        self.code    = _utils.scrape_html_table(first_table)[0][1]
-        self.acronym = _utils.scrape_html_table(first_table)[0][4]
+        first_row = _utils.scrape_html_table(first_table)[0]
+
+        self.code    = first_row[1]
+        self.acronym = first_row[4]
 
 
     def _parse_matches(self, contents):
@@ -300,7 +329,7 @@ class CurricularUnit:
                                         datetime.date(2018, 10, 12))}}}
         """
         html = credentials.get_html(self.url) # curricular unit page
-        soup = _bs4.BeautifulSoup(html, "lxml")
+        soup = _utils.make_soup(html)
 
         tag = soup.find("a", {"title" : "Contacts"})
 
@@ -314,11 +343,12 @@ class CurricularUnit:
         url = self.base_url.replace("/en/", "/pt/") + tag["href"]
 
         html = credentials.get_html(url) # contents page
-        soup = _bs4.BeautifulSoup(html, "lxml")
-        content = soup.find("div", {"id" : "conteudoinner"})
 
         if "Não existem conteúdos para ver" in html:
             return {}
+
+        soup = _utils.make_soup(html, parse_only = _INNER_STRAINER)
+        content = soup.find("div", {"id" : "conteudoinner"})
         
         def has_pct_grupo(a):
             try:
@@ -332,7 +362,7 @@ class CurricularUnit:
         url = url + "&" + query 
 
         html = credentials.get_html(url) # contents page with all the folders open
-        soup = _bs4.BeautifulSoup(html, "lxml")
+        soup = _utils.make_soup(html, parse_only = _INNER_STRAINER)
         content = soup.find("div", {"id" : "conteudoinner"})
         
         files_and_dirs = [p for p in content.find_all("p") if p.has_attr("class")]
@@ -368,7 +398,8 @@ class CurricularUnit:
 
                         if file_type == "file":
                             
-                            upload_time = _datetime.date(*map(int, p.find("span", {"class" : "t"}).string.split("-")[1].split("/")))
+                            year, month, day = _UPLOAD_DATE_REGEX.search(p.find("span", {"class" : "t"}).string).groups()
+                            upload_time = _datetime.date(int(year), int(month), int(day))
                             url = self.base_url.replace("/en/", "/pt/") + p.a["href"]
                         else:
                             upload_time = _datetime.date.today() # A placeholder value
@@ -437,21 +468,20 @@ class CurricularUnit:
             data.append((student, status, number_of_registrations, student_type))
                     
         n_pages    = ((self.number_of_students - 1) // 50) + 1 # Example: ((200 - 1) // 50) + 1 = 4
-        pages_urls = []
-        for n in range(1, n_pages + 1):
-            url = self.base_url + _utils.SIG_URLS["curricular unit students"] + "?" + _urllib.parse.urlencode({"pv_ocorrencia_id" : str(self.pv_ocorrencia_id), "pv_num_pag" : str(n)})
-            pages_urls.append(url)
+        pages_url  = self.base_url + _utils.SIG_URLS["curricular unit students"] + "?" + _urllib.parse.urlencode({"pv_ocorrencia_id" : str(self.pv_ocorrencia_id)}) + "&pv_num_pag="
+        pages_urls = [pages_url + str(n) for n in range(1, n_pages + 1)]
         
         for html in credentials.get_html_async(pages_urls):
-            soup = _bs4.BeautifulSoup(html, "lxml")
+            soup = _utils.make_soup(html, parse_only = _INNER_STRAINER)
             table = soup.find("table", {"class" : "dadossz"})
             tables.append(table)
 
 
+        student_page_url = self.base_url + _utils.SIG_URLS["student page"] + "?pv_num_unico=" # The usernames are digits only, no need to urlencode them
         student_urls = []
         for table in tables: # get all the student urls
             student_usernames = _re.findall(r"(\d\d\d\d\d\d\d\d\d)", str(table))
-            student_urls.extend(self.base_url + _utils.SIG_URLS["student page"] + "?" + _urllib.parse.urlencode({"pv_num_unico" : username}) for username in student_usernames)
+            student_urls.extend(student_page_url + username for username in student_usernames)
         _cache.get_html_async(student_urls, use_cache = use_cache) # Refreshing the cache
 
         for table in tables:
@@ -466,10 +496,7 @@ class CurricularUnit:
         Returns:
             A list of dicts
         """
-        html = credentials.get_html(self.base_url.replace("/en/", "/pt/") + _utils.SIG_URLS["curricular unit timetable"], {"pv_ocorrencia_id" : self.pv_ocorrencia_id})
-        soup = _bs4.BeautifulSoup(html, "lxml")
-
-        return _timetable.parse_current_timetable(credentials, soup.a["href"], ignore_coherence)
+        return _timetable.parse_current_timetable(credentials, self._timetable_url(credentials), ignore_coherence)
 
     def all_timetables(self, credentials : _Credentials.Credentials, ignore_coherence : bool = False) -> dict:
         """Parses all the timetables related to this curricular unit
@@ -481,10 +508,16 @@ class CurricularUnit:
             list of dictionaries (see :obj:`timetable.parse_timetable` for an example
             of such a list).
         """
+        return _timetable.parse_timetables(credentials, self._timetable_url(credentials), ignore_coherence)
+
+    def _timetable_url(self, credentials : _Credentials.Credentials) -> str:
+        """Returns the url of the timetable page linked by the curricular unit timetable page.
+        Both :func:`timetable` and :func:`all_timetables` start from here, and the html
+        is kept in the credentials' cache, so only the first call makes a web request"""
         html = credentials.get_html(self.base_url.replace("/en/", "/pt/") + _utils.SIG_URLS["curricular unit timetable"], {"pv_ocorrencia_id" : self.pv_ocorrencia_id})
-        soup = _bs4.BeautifulSoup(html, "lxml")
+        soup = _utils.make_soup(html, parse_only = _LINKS_STRAINER)
 
-        return _timetable.parse_timetables(credentials, soup.a["href"], ignore_coherence)
+        return soup.a["href"]
 
     def other_occurrences(self, use_cache : bool = True) -> tuple:
         """Returns the occurrences of this curricular unit from other years as a
@@ -522,15 +555,15 @@ class CurricularUnit:
             CurricularUnit(272639))
         """
         html = _cache.get_html(self.url)
-        soup = _bs4.BeautifulSoup(html, "lxml")
+        soup = _utils.make_soup(html)
 
         tag = soup.find("a", {"title" : "Other occurrences"})
         url = self.base_url + tag["href"]
 
         html = _cache.get_html(url)         # Now we have the html of the "other occurrences" page 
-        soup = _bs4.BeautifulSoup(html, "lxml")
+        soup = _utils.make_soup(html)
 
-        table = soup.find_all("table", {"class" : "dados"})[1]
+        table = soup.find_all("table", {"class" : "dados"}, limit = 2)[1]
         course_tags = table.find_all("a")
 
         _cache.get_html_async((self.base_url + a_tag["href"] for a_tag in course_tags), use_cache = use_cache) # Refresh the cache
@@ -563,13 +596,14 @@ class CurricularUnit:
         """
         
         html = credentials.get_html(self.base_url + _utils.SIG_URLS["curricular unit statistics"], params = {"pv_ocorrencia_id" : str(self.pv_ocorrencia_id)})
-        soup = _bs4.BeautifulSoup(html, "lxml")
 
         if "Não foram encontrados estudantes inscritos na ocorrência indicada." in html:
             raise LookupError(f"The statistics for {self.__repr__()} have not been released yet")
 
+        soup = _utils.make_soup(html)
+
         table = soup.find_all("table")[-1] # get the last table of the page
-        table_data = table.find_all("td", {"class" : "k n"})[0:3] # get the first three tds
+        table_data = table.find_all("td", {"class" : "k n"}, limit = 3) # get the first three tds
 
         registered, evaluated, approved = map(lambda tag: int(tag.string), table_data)
 
@@ -617,10 +651,11 @@ class CurricularUnit:
         """
 
         html = credentials.get_html(self.base_url + _utils.SIG_URLS["curricular unit grades distribution"], params = {"pv_ocorrencia_id" : str(self.pv_ocorrencia_id)})
-        soup = _bs4.BeautifulSoup(html, "lxml")
 
         if "Não foram encontrados estudantes avaliados na ocorrência indicada." in html:
             raise LookupError(f"The statistics for {self.__repr__()} have not been released yet")
+
+        soup = _utils.make_soup(html)
         
         table = soup.find_all("table")[-2] # get the second last table of the page
         tbody = table.find("tbody")
@@ -678,7 +713,7 @@ class CurricularUnit:
         """
         
         html = credentials.get_html(self.base_url + _utils.SIG_URLS["curricular unit stats history"], params = {"pv_ocorrencia_id" : str(self.pv_ocorrencia_id), "pv_n_prev_alet" : "20"})
-        soup = _bs4.BeautifulSoup(html, "lxml")
+        soup = _utils.make_soup(html)
 
         table = soup.find_all("table")[-1] # get the last table of the page
         tbody = table.find("tbody")
@@ -742,7 +777,7 @@ class CurricularUnit:
             }
         """
         html = credentials.get_html(self.base_url + _utils.SIG_URLS["curricular unit classes"], params = {"pv_ocorrencia_id" : str(self.pv_ocorrencia_id)})   
-        soup = _bs4.BeautifulSoup(html, "lxml")
+        soup = _utils.make_soup(html)
 
         for meta in soup.find_all("meta"):
             if "http-equiv" in meta.attrs and meta.attrs["http-equiv"] == "Refresh":
@@ -759,12 +794,13 @@ class CurricularUnit:
 
         for url in urls:
             html = credentials.get_html(url)
-            soup = _bs4.BeautifulSoup(html, "lxml")
-            contents = soup.find("div", {"id" : "conteudo"})
 
             if "There are no classes" in html:
                 continue
 
+            soup = _utils.make_soup(html)
+            contents = soup.find("div", {"id" : "conteudo"})
+
             all_students_urls = (self.base_url + tag["href"] for tag in contents.find_all("a") if tag.parent.name == "td")
             _cache.get_html_async(all_students_urls, use_cache = use_cache) # refresh the cache
             
@@ -875,14 +911,16 @@ class CurricularUnit:
                                     ...]}
         """
         html = credentials.get_html(self.base_url + _utils.SIG_URLS["curricular unit results"], params = {"pv_ocorr_id" : str(self.pv_ocorrencia_id)})
-        soup = _bs4.BeautifulSoup(html, "lxml")
 
         if "Não tem permissões para aceder a este conteúdo" in html:
             raise PermissionError("Your Credentials object does not have access to this curricular unit's results")
+
+        soup = _utils.make_soup(html)
         
         tags = (tag for tag in soup.find_all("a") if "lres_geral.show_pauta_resul" in str(tag))
 
         result = {}
+        student_page_url = self.base_url + _utils.SIG_URLS["student page"] + "?pv_num_unico=" # The usernames are digits only, no need to urlencode them
 
         for tag in tags:
             result[tag.string] = []
@@ -890,7 +928,7 @@ class CurricularUnit:
             url = self.base_url + tag["href"]
 
             html = credentials.get_html(url)
-            soup = _bs4.BeautifulSoup(html, "lxml")
+            soup = _utils.make_soup(html, parse_only = _INNER_STRAINER)
 
             table = soup.find("table", {"class" : "dadossz"})
 
@@ -899,7 +937,7 @@ class CurricularUnit:
             student_urls = []
             for row in rows: # get all the student urls
                 student_usernames = _re.findall(r"(\d\d\d\d\d\d\d\d\d)", str(row))
-                student_urls.extend(self.base_url + _utils.SIG_URLS["student page"] + "?" + _urllib.parse.urlencode({"pv_num_unico" : username}) for username in student_usernames)
+                student_urls.extend(student_page_url + username for username in student_usernames)
             _cache.get_html_async(student_urls, use_cache = use_cache) # Refreshing the cache
 
             for row in rows:
@@ -938,18 +976,35 @@ class CurricularUnit:
             # Microprocessors and Personal Computers
         """
 
-        matches = _re.findall(r"pv_ocorrencia_id=(\d+)$", url)
+        pv_ocorrencia_id, base_url = _parse_url(url, base_url)
+
+        return CurricularUnit(pv_ocorrencia_id, use_cache, base_url = base_url)
+    
+    @classmethod
+    def _forget(cls, key):
+        """Curricular units aren't reused like students and teachers are, so there's nothing to forget (see :func:`_internal_utils.build_bulk`)"""
+    
+    @classmethod
+    def from_urls(cls, urls, use_cache : bool = True, base_url : str = "https://sigarra.up.pt/feup/en/", n_workers : int = 10):
+        """Same as :meth:`from_url`, but for several urls at once: the webpages are fetched concurrently and the
+        corresponding :obj:`CurricularUnit` objects are returned.
         
-        if len(matches) == 0:
-            raise ValueError(f"from_url() 'url' argument \"{url}\" is not a valid curricular unit url")
+        Args:
+            urls (iterable(str)): The urls of the curricular units' sigarra pages
+            use_cache (:obj:`bool`, optional): Attempts to use the cache if True, otherwise it will fetch from sigarra
+            base_url (:obj:`str`, optional): The url of the faculty (in english) (defaults to "https://sigarra.up.pt/feup/en/")
+            n_workers (:obj:`int`, optional): The number of concurrent requests (defaults to 10)
         
-        pv_ocorrencia_id = int(matches[0])
-
-        matches = _re.findall(r"^https?://sigarra\.up\.pt/(\w+)/", url)
-        if len(matches) == 1:
-            base_url = f"https://sigarra.up.pt/{matches[0]}/en/"
+        Returns:
+            A tuple of :obj:`CurricularUnit` objects, in the same order as urls
+        """
+        
+        keys = [_parse_url(url, base_url) for url in urls]
+        urls = [f"{base_url}{_utils.SIG_URLS['curricular unit']}?pv_ocorrencia_id={pv_ocorrencia_id}" for pv_ocorrencia_id, base_url in keys]
+        
+        _cache.get_html_async(urls, n_workers, use_cache) # Refreshing the cache
 
-        return CurricularUnit(pv_ocorrencia_id, use_cache, base_url = base_url)
+        return _utils.build_bulk(cls, keys, use_cache)
     
     @classmethod
     def from_a_tag(cls, bs4_tag : _bs4.Tag, use_cache : bool = True, base_url : str = "https://sigarra.up.pt/feup/en/"):
@@ -969,6 +1024,27 @@ class CurricularUnit:
         
         return CurricularUnit.from_url(bs4_tag["href"], use_cache, base_url = base_url)
     
+    @classmethod
+    def bulk(cls, pv_ocorrencia_ids, use_cache : bool = True, base_url : str = "https://sigarra.up.pt/feup/en/", n_workers : int = 10):
+        """Fetches the webpages of several curricular units concurrently and returns the corresponding :obj:`CurricularUnit` objects.
+        
+        Args:
+            pv_ocorrencia_ids (iterable(:obj:`int`)): The curricular units' pv_ocorrencia_ids
+            use_cache (:obj:`bool`, optional): Attempts to use the cache if True, otherwise it will fetch from sigarra
+            base_url (:obj:`str`, optional): The url of the faculty (in english) (defaults to "https://sigarra.up.pt/feup/en/")
+            n_workers (:obj:`int`, optional): The number of concurrent requests (defaults to 10)
+        
+        Returns:
+            A tuple of :obj:`CurricularUnit` objects, in the same order as pv_ocorrencia_ids
+        """
+        
+        keys = [(pv_ocorrencia_id, base_url) for pv_ocorrencia_id in pv_ocorrencia_ids]
+        urls = [f"{base_url}{_utils.SIG_URLS['curricular unit']}?pv_ocorrencia_id={pv_ocorrencia_id}" for pv_ocorrencia_id, _ in keys]
+        
+        _cache.get_html_async(urls, n_workers, use_cache) # Refreshing the cache
+
+        return _utils.build_bulk(cls, keys, use_cache)
+    
     # Comparisons between curricular units are made with the pv_ocorrencia_id
     def __eq__(self, other):
         if isinstance(other, CurricularUnit):
@@ -1002,7 +1078,16 @@ class CurricularUnit:
     
     @property
     def __dict__(self): # This is done for compatibility reasons (vars)
-        return {attribute : getattr(self, attribute) for attribute in self.__slots__}
+        return dict(zip(self.__slots__, self._SLOT_GETTER(self)))
+
+    # Pickling support (used when objects are stored in a shelve, for example).
+    # The state is a plain tuple in slot order, which avoids building a dict through the __dict__ property
+    def __getstate__(self):
+        return self._SLOT_GETTER(self)
+
+    def __setstate__(self, state):
+        for attribute, value in zip(self.__slots__, state):
+            object.__setattr__(self, attribute, value)
 
     def __hash__(self):
         return hash(self.pv_ocorrencia_id)
@@ -1015,3 +1100,16 @@ class CurricularUnit:
     
     def __str__(self):
         return f"{self.acronym} ({self.academic_year}/{self.academic_year + 1})" # e.g. ALGE (2019/2019)
+
+
+def _parse_redirection_url(html : str):
+    """Returns the url the page redirects to, or None if the page isn't a redirection page"""
+    if "Refresh" not in html: # No need to parse anything
+        return None
+
+    soup = _utils.make_soup(html, parse_only = _REDIRECT_STRAINER)
+
+    if soup.find("meta", {"http-equiv" : "Refresh"}) == None:
+        return None
+
+    return soup.find("a")["href"]
@@ -1,9 +1,9 @@
-import re as _re
-import urllib as _urllib
-
+import functools as _functools
 import bs4 as _bs4
 import requests as _requests
 import warnings as _warnings
+import weakref as _weakref
+from lxml import etree as _etree
 
 from . import _Credentials
 from . import _internal_utils as _utils
@@ -12,6 +12,17 @@ from . import cache as _cache
 
 __all__ = ["Student"]
 
+# The student page is parsed with these XPath expressions, which are compiled only once
+_NAME_XPATH                = _etree.XPath("//" + _utils.class_xpath("div", "estudante-info-nome"))
+_PERSONAL_WEBPAGE_XPATH    = _etree.XPath("//" + _utils.class_xpath("div", "pagina-pessoal") + "/descendant::a[1]/@href")
+_LINKS_XPATH               = _etree.XPath("(//" + _utils.class_xpath("div", "estudante-info-numero") + ")[1]/following-sibling::div/descendant::a[1]/@href")
+_COURSE_BOX_XPATH          = _etree.XPath("//" + _utils.class_xpath("div", "estudante-lista-curso-activo"))
+_COURSE_NAME_XPATH         = _etree.XPath(".//" + _utils.class_xpath("div", "estudante-lista-curso-nome"))
+_COURSE_INSTITUTION_XPATH  = _etree.XPath(".//" + _utils.class_xpath("div", "estudante-lista-curso-instit"))
+_COURSE_TABLE_ROWS_XPATH   = _etree.XPath("(.//" + _utils.class_xpath("table", "formulario") + ")[1]/tr[position() <= 3]")
+_EMAIL_XPATH               = _etree.XPath("(//" + _utils.class_xpath("div", "email-institucional") + "//a)[1]")
+
+@_functools.total_ordering
 class Student:
     """This class represents a FEUP student as seen from their sigarra webpage.
 
@@ -51,19 +62,47 @@ class Student:
         # ({'course': Course(742, 2019), 'institution': 'Faculty of Engineering', 'first academic year': 2018},)
     """
 
-    __slots__ = ["name", "links", "personal_webpage", "username", "courses", "url", "base_url"]
+    _attributes = ("name", "links", "personal_webpage", "username", "courses", "url", "base_url")
+
+    __slots__ = _attributes + ("__weakref__",) # __weakref__ is needed by _instances
 
     _locked_students = set() # The students whose information is inaccessible
 
+    _missing_students = set() # The (username, base_url) pairs of the students that don't exist
+
+    _instances = _weakref.WeakValueDictionary() # Maps (username, base_url) to the Student object, see __new__
+
+    def __new__(cls, username : int = None, use_cache : bool = True, base_url : str = "https://sigarra.up.pt/feup/en/"):
+        # If this student has already been loaded (and is still alive somewhere), there's no need to parse its page again
+        if use_cache:
+            student = cls._instances.get((username, base_url))
+            if student is not None and _cache._get_valid_entry(student.url) != None: # Only while its page is still valid in the cache
+                return student
+        
+        return super().__new__(cls)
+
+    @classmethod
+    def _forget(cls, key):
+        """Forgets the student with the given (username, base_url) key, so that its page is parsed again the next time it's loaded"""
+        cls._instances.pop(key, None)
+        cls._missing_students.discard(key)
+
     def __init__(self, username : int, use_cache : bool = True, base_url : str = "https://sigarra.up.pt/feup/en/"):
 
+        if use_cache and self._instances.get((username, base_url)) is self:
+            return # This object was returned by __new__ and it's already initialized
+
         self.username = username
         self.base_url = base_url
-        self.url = self.base_url + _utils.SIG_URLS["student page"] + "?" + _urllib.parse.urlencode({"pv_num_unico" : str(username)})
+        self.url = f"{self.base_url}{_utils.SIG_URLS['student page']}?pv_num_unico={username}" # The username is a number, there's nothing to urlencode
 
         if username in self._locked_students:
             return
 
+        # The student is only known not to exist while the page that said so is still valid in the cache
+        if use_cache and (username, base_url) in self._missing_students and _cache._get_valid_entry(self.url) != None:
+            raise ValueError(f"Student with username '{username}' doesn't exist")
+
         try:
             html = _cache.get_html(url = self.url, use_cache = use_cache) # Getting the html
         except _requests.exceptions.HTTPError as e:
@@ -73,18 +112,21 @@ class Student:
                 return
             else:
                 raise e
-        soup = _bs4.BeautifulSoup(html, "lxml")
 
         if "Estudante não encontrado." in html:
+            self._missing_students.add((username, base_url))
             raise ValueError(f"Student with username '{username}' doesn't exist")
         
         # Otherwise, it's a normal student page
-        self._load_normal_student_page(soup, use_cache)
+        self._load_normal_student_page(html, use_cache)
 
-    def _load_normal_student_page(self, soup, use_cache : bool):
-        
-        if "Problem found" in str(soup): # the only info we can get is the name (I don't think it's even the entire name)
-            content_soup = soup.find("div", {"id" : "conteudoinner"})
+        self._missing_students.discard((username, base_url)) # The page may have been refetched with use_cache = False
+        self._instances[(username, base_url)] = self
+
+    def _load_normal_student_page(self, html : str, use_cache : bool, tree = None):
+        # tree is the lxml tree of html, if the caller has already parsed it
+        if "Problem found" in html: # the only info we can get is the name (I don't think it's even the entire name)
+            content_soup = _utils.make_soup(html).find("div", {"id" : "conteudoinner"})
             self.name = content_soup.contents[5].string
 
             self.links = () # empty tuple
@@ -93,36 +135,32 @@ class Student:
 
             return
         
-        self.name = soup.find("div", {"class" : "estudante-info-nome"}).string.strip()
+        if tree == None:
+            tree = _utils.parse_html(html)
+
+        self.name = _utils.element_string(_NAME_XPATH(tree)[0]).strip()
         
-        personal_webpage_div = soup.find("div", {"class" : "pagina-pessoal"})
-        if personal_webpage_div == None:                              # Does the student have a webpage?
+        personal_webpage = _PERSONAL_WEBPAGE_XPATH(tree)
+        if len(personal_webpage) == 0:                                # Does the student have a webpage?
             self.personal_webpage = None
         else:
-            self.personal_webpage = personal_webpage_div.a["href"]
+            self.personal_webpage = str(personal_webpage[0])
         
-        self.links = []
-        username_link = soup.find("div", {"class" : "estudante-info-numero"})
-        for div in username_link.find_next_siblings("div"):
-            link = div.a
-            if link == None:
-                continue
-            else:
-                self.links.append(link["href"])
-        self.links = tuple(self.links)
+        self.links = tuple(str(href) for href in _LINKS_XPATH(tree))
         
         self.courses = []
-        for course_div in soup.find_all("div", {"class" : "estudante-lista-curso-activo"}): # Iterate over the courses "boxes"
+        for course_div in _COURSE_BOX_XPATH(tree): # Iterate over the courses "boxes"
 
-            name_div = course_div.find("div", {"class" : "estudante-lista-curso-nome"})
-            if name_div.a == None: # There is no link
-                course = name_div.string
+            name_div = _COURSE_NAME_XPATH(course_div)[0]
+            link = name_div.find(".//a")
+            if link == None: # There is no link
+                course = _utils.element_string(name_div)
             else:
-                course = _Course.Course.from_a_tag(name_div.a, use_cache, base_url = self.base_url) # If there is a link, get the Course object
+                course = _Course.Course.from_url(link.get("href"), use_cache, base_url = self.base_url) # If there is a link, get the Course object
             
-            institution = course_div.find("div", {"class" : "estudante-lista-curso-instit"}).string
+            institution = _utils.element_string(_COURSE_INSTITUTION_XPATH(course_div)[0])
 
-            first_academic_year = _utils.parse_academic_year(course_div)
+            first_academic_year = _utils.parse_academic_year(course_div.text_content())
 
             self.courses.append({"course" : course, "institution" : institution, "first academic year" : first_academic_year})
         self.courses = tuple(self.courses)
@@ -150,16 +188,16 @@ class Student:
             # Daniel Filipe Amaro Monteiro
         """
         
-        matches = _re.findall(r"pv_num_unico=(\d+)$", url)
+        _, separator, username = url.rpartition("pv_num_unico=") # The username is at the end of the url
         
-        if len(matches) == 0:
+        if separator == "" or not username.isdecimal():
             raise ValueError(f"from_url() 'url' argument \"{url}\" is not a valid student url")
         
-        username = int(matches[0])
+        username = int(username)
 
-        matches = _re.findall(r"^https?://sigarra\.up\.pt/(\w+)/", url)
-        if len(matches) == 1:
-            base_url = f"https://sigarra.up.pt/{matches[0]}/en/"
+        match = _utils.FACULTY_REGEX.search(url)
+        if match != None:
+            base_url = f"https://sigarra.up.pt/{match.group(1)}/en/"
 
         return Student(username, use_cache, base_url = base_url)
     
@@ -184,6 +222,27 @@ class Student:
         
         return Student.from_url(bs4_tag["href"], use_cache, base_url = base_url)
     
+    @classmethod
+    def bulk(cls, usernames, use_cache : bool = True, base_url : str = "https://sigarra.up.pt/feup/en/", n_workers : int = 10):
+        """Fetches the webpages of several students concurrently and returns the corresponding :obj:`Student` objects.
+        
+        Args:
+            usernames (iterable(:obj:`int`)): The student usernames (up numbers)
+            use_cache (:obj:`bool`, optional): Attempts to use the cache if True, otherwise it will fetch from sigarra
+            base_url (:obj:`str`, optional): The url of the faculty (in english) (defaults to "https://sigarra.up.pt/feup/en/")
+            n_workers (:obj:`int`, optional): The number of concurrent requests (defaults to 10)
+        
+        Returns:
+            A tuple of :obj:`Student` objects, in the same order as usernames
+        """
+        
+        keys = [(username, base_url) for username in usernames]
+        urls = [f"{base_url}{_utils.SIG_URLS['student page']}?pv_num_unico={username}" for username, _ in keys]
+        
+        _cache.get_html_async(urls, n_workers, use_cache) # Refreshing the cache
+
+        return _utils.build_bulk(cls, keys, use_cache)
+    
     def full_info(self, credentials : _Credentials.Credentials) -> dict:
         """Returns a dictionary with the information that one can get when it is logged in.
 
@@ -232,10 +291,10 @@ class Student:
             raise TypeError(f"full_info() 'credentials' argument must be a Credentials object, not '{type(credentials).__name__}'")
 
         html = credentials.get_html(self.url)
-        soup = _bs4.BeautifulSoup(html, "lxml")
+        tree = _utils.parse_html(html)
 
         if not hasattr(self, "name"):
-            self._load_normal_student_page(soup, True)
+            self._load_normal_student_page(html, True, tree) # The tree is parsed only once
 
         info = {
             "name"             : self.name,
@@ -245,16 +304,17 @@ class Student:
             "url"              : self.url
         }
 
-        email_div = soup.find("div", {"class" : "email-institucional"})
+        email_a = _EMAIL_XPATH(tree)
 
-        if email_div != None:
-            email = email_div.a.contents[0] + "@" + email_div.a.contents[-1]
+        if len(email_a) != 0:
+            email_nodes = email_a[0].xpath("node()") # The "@" is an image, the email is split around it
+            email = f"{email_nodes[0]}@{email_nodes[-1]}"
         else:
             email = None
 
         info["email"] = email
 
-        courses = [_parse_course_box(div, self.base_url) for div in soup.find_all("div", {"class" : "estudante-lista-curso-activo"})]
+        courses = [_parse_course_box(div, self.base_url) for div in _COURSE_BOX_XPATH(tree)]
         info["courses"] = courses
 
         return info
@@ -264,41 +324,32 @@ class Student:
         if isinstance(other, Student):
             return self.username == other.username
         else:
-            return NotImplementedError
-        
-    def __gt__(self, other):
-        if isinstance(other, Student):
-            return self.username > other.username
-        else:
-            return NotImplementedError
+            return NotImplemented
     
-    def __ge__(self, other):
-        if isinstance(other, Student):
-            return self.username >= other.username
-        else:
-            return NotImplementedError
-    
-    def __lt__(self, other):
+    def __lt__(self, other): # total_ordering derives the other comparisons from this one
         if isinstance(other, Student):
             return self.username < other.username
         else:
-            return NotImplementedError
-    
-    def __le__(self, other):
-        if isinstance(other, Student):
-            return self.username <= other.username
-        else:
-            return NotImplementedError
+            return NotImplemented
     
     @property
     def __dict__(self): # This is done for compatibility reasons (vars)
-        return {attribute : getattr(self, attribute) for attribute in self.__slots__}
+        return {attribute : getattr(self, attribute) for attribute in self._attributes}
+
+    # Pickling support. Only the attributes that are set are saved, since students whose
+    # page can't be fetched (see _locked_students) have most of their attributes unset
+    def __getstate__(self):
+        return {attribute : getattr(self, attribute) for attribute in self._attributes if hasattr(self, attribute)}
+
+    def __setstate__(self, state):
+        for attribute, value in state.items():
+            object.__setattr__(self, attribute, value)
 
     def __hash__(self):
         return hash(self.username)
     
     def __repr__(self):
-        if self.base_url == "https://sigarra.up.pt/feup/en/":
+        if self.base_url == _utils.DEFAULT_BASE_URL:
             return f"Student({self.username})"
         else:
             return f"Student({self.username}, base_url = {self.base_url})"
@@ -307,8 +358,8 @@ class Student:
         return f"{self.name} ({self.username})"
 
 
-def _parse_course_box(bs_course_div, base_url):
-    """Parses the the information available in the "estudante-lista-curso-activo" div.
+def _parse_course_box(course_div, base_url):
+    """Parses the the information available in the "estudante-lista-curso-activo" div (an lxml element, as returned by _COURSE_BOX_XPATH).
     NOTE: Doesn't work with unpriviledged access to the student page
     It returns a dictionary like this: 
     {
@@ -320,21 +371,17 @@ def _parse_course_box(bs_course_div, base_url):
     }
     """
     
-    if not isinstance(bs_course_div, _bs4.BeautifulSoup) and not isinstance(bs_course_div, _bs4.element.Tag):
-        raise TypeError(f"parse_course_box() 'bs_course_div' argument must either be a bs4.element.Tag or a bs4.BeautifulSoup, not '{type(bs_course_div).__name__}'")
-    
-    name_div = bs_course_div.find("div", {"class" : "estudante-lista-curso-nome"})
-    if name_div.a == None:  # There is no link
-        course = name_div.string
+    name_div = _COURSE_NAME_XPATH(course_div)[0]
+    link = name_div.find(".//a")
+    if link == None:  # There is no link
+        course = _utils.element_string(name_div)
     else:
-        course = _Course.Course.from_a_tag(name_div.a, base_url=base_url)
+        course = _Course.Course.from_url(link.get("href"), base_url=base_url)
         
-    institution = bs_course_div.find("div", {"class": "estudante-lista-curso-instit"}).string
+    institution = _utils.element_string(_COURSE_INSTITUTION_XPATH(course_div)[0])
     
-    table = bs_course_div.find("table", {"class" : "formulario"})
-    table_data = _utils.scrape_html_table(table)
-            
-    current_year, status, first_academic_year = [row[1] for row in table_data[:3]]
+    # The second cell of each of the first 3 rows of the table
+    current_year, status, first_academic_year = [_utils.element_string(row.xpath("th|td")[1]) for row in _COURSE_TABLE_ROWS_XPATH(course_div)]
     
     try:
         current_year = int(current_year)
@@ -1,14 +1,79 @@
-import re as _re
-import urllib as _urllib
+import operator as _operator
+import functools as _functools
+import weakref as _weakref
 
 import bs4 as _bs4
 import PIL as _PIL
+from lxml import etree as _etree
 
 from . import _internal_utils as _utils
 from . import cache as _cache
 
 __all__ = ["Teacher"]
 
+# The teacher page is parsed with these XPath expressions, which are compiled only once
+_PERSONAL_INFO_XPATH = _etree.XPath("//" + _utils.class_xpath("div", "informacao-pessoal-dados-dados"))
+_LINKS_XPATH         = _etree.XPath("(//" + _utils.class_xpath("table", "tabelasz") + ")[1]//a/@href")
+_FUNCTIONS_XPATH     = _etree.XPath("//" + _utils.class_xpath("div", "informacao-pessoal-funcoes"))
+_TOPO_XPATH          = _etree.XPath(".//" + _utils.class_xpath("td", "topo"))
+_PRESENTATION_XPATH  = _etree.XPath("//" + _utils.class_xpath("div", "informacao-pessoal-apresentacao"))
+
+# Maps the labels of the teacher page rows (without the ":") to the attribute the row holds
+_PERSONAL_INFO_LABELS = {
+    "Name"                 : "name",
+    "Acronym"              : "acronym",
+    "Sigla"                : "acronym",
+    "Status"               : "status",
+    "Estado"               : "status",
+    "Institutional E-mail" : "email",
+    "E-mail"               : "email",
+    "Email"                : "email",
+    "Voip"                 : "voip",
+    "Rooms"                : "rooms",
+    "Salas"                : "rooms"
+}
+
+_FUNCTIONS_LABELS = {
+    "Category"           : "category",
+    "Categoria"          : "category",
+    "Career"             : "career",
+    "Carreira"           : "career",
+    "Professional Group" : "profession",
+    "Department"         : "department"
+}
+
+def _rows_by_attribute(rows, labels):
+    """Returns a dictionary that maps each attribute from labels.values() to the
+    cells of the row with that label (the first cell is the label itself)"""
+    result = {}
+    for row in rows:
+        cells = row.findall("td") # Only the row's own cells, not the ones from nested tables
+        if len(cells) == 0:
+            continue
+
+        label = cells[0].text_content().strip().rstrip(":")
+        attribute = labels.get(label) # e.g. "Name:" -> "name"
+
+        if attribute == None: # Labels that aren't in the table are matched by substring, e.g. "Personal E-mail" -> "email"
+            attribute = next((value for key, value in labels.items() if key in label), None)
+
+        if attribute != None:
+            result[attribute] = cells
+    
+    return result
+
+def _lazy_attribute(name):
+    """Returns a read-only property for the attribute "name", which is parsed by :func:`Teacher._load_details` on first access"""
+    slot = "_" + name
+
+    def getter(self):
+        if self._html != None:
+            self._load_details()
+        return getattr(self, slot)
+    
+    return property(getter)
+
+@_functools.total_ordering
 class Teacher:
     """This class represents a FEUP teacher as seen from their sigarra webpage.
 
@@ -56,28 +121,75 @@ class Teacher:
         print(jlopes.personal_webpage)
         # http://www.fe.up.pt/~jlopes/
     """
-    __slots__ = ["p_codigo", "name", "acronym", "status", "links", "personal_webpage", "url", "voip",
-                 "email", "rooms", "category", "career", "profession", "department", "presentation", "base_url"]
+    _attributes = ("p_codigo", "name", "acronym", "status", "links", "personal_webpage", "url", "voip",
+                   "email", "rooms", "category", "career", "profession", "department", "presentation", "base_url")
+
+    # Where each attribute is stored, in _attributes order. category, career, profession, department
+    # and presentation are properties that are only parsed when first accessed, see _load_details
+    _state_slots = ("p_codigo", "name", "acronym", "status", "links", "personal_webpage", "url", "voip",
+                    "email", "rooms", "_category", "_career", "_profession", "_department", "_presentation", "base_url")
+
+    __slots__ = _state_slots + ("_html", "__weakref__") # __weakref__ is needed by _instances
+
+    _ATTRIBUTES_GETTER = _operator.attrgetter(*_attributes) # Returns a tuple with the attributes' values, in _attributes order
+
+    _instances = _weakref.WeakValueDictionary() # Maps (p_codigo, base_url) to the Teacher object, see __new__
+
+    _missing_teachers = set() # The (p_codigo, base_url) pairs of the teachers that don't exist
+
+    def __new__(cls, p_codigo : int = None, use_cache : bool = True, base_url : str = "https://sigarra.up.pt/feup/en/"):
+        # If this teacher has already been loaded (and is still alive somewhere), there's no need to parse its page again
+        if use_cache:
+            teacher = cls._instances.get((p_codigo, base_url))
+            if teacher is not None and _cache._get_valid_entry(teacher.url) != None: # Only while its page is still valid in the cache
+                return teacher
+        
+        return super().__new__(cls)
+
+    @classmethod
+    def _forget(cls, key):
+        """Forgets the teacher with the given (p_codigo, base_url) key, so that its page is parsed again the next time it's loaded"""
+        cls._instances.pop(key, None)
+        cls._missing_teachers.discard(key)
 
     def __init__(self, p_codigo : int, use_cache : bool = True, base_url : str = "https://sigarra.up.pt/feup/en/"):
 
-        for attribute in self.__slots__:
-            setattr(self, attribute, None)
+        if use_cache and self._instances.get((p_codigo, base_url)) is self:
+            return # This object was returned by __new__ and it's already initialized
+
+        redirection_url = f"{base_url}{_utils.SIG_URLS['redirection page']}?pct_codigo={p_codigo}" # Where the teacher is searched if it isn't in this faculty
+
+        # The teacher is only known not to exist while the page that said so is still valid in the cache
+        if use_cache and (p_codigo, base_url) in self._missing_teachers and _cache._get_valid_entry(redirection_url) != None:
+            raise ValueError(f"Teacher with p_codigo {p_codigo} doesn't exist")
+
+        # The attributes that might not be found in the page (p_codigo, url, base_url and links are always set below)
+        self.name = self.acronym = self.status = self.personal_webpage = self.voip = self.email = self.rooms = None
+        self._category = self._career = self._profession = self._department = self._presentation = None
 
         self.p_codigo = p_codigo
         self.base_url = base_url
-        self.url = self.base_url + _utils.SIG_URLS["teacher"] + "?" + _urllib.parse.urlencode({"p_codigo" : str(p_codigo)})
+        self.url = f"{self.base_url}{_utils.SIG_URLS['teacher']}?p_codigo={p_codigo}" # p_codigo is a number, there's nothing to urlencode
         
         html = _cache.get_html(url = self.url, use_cache = use_cache) # Getting the html
-        soup = _bs4.BeautifulSoup(html, "lxml")
 
-        if "O funcionário indicado não foi encontrado." in html:
+        tree = _utils.parse_html(html)
+        personal_info = _PERSONAL_INFO_XPATH(tree)
+
+        # The html is only searched for the error message if the page doesn't look like a teacher page
+        if len(personal_info) == 0 and "O funcionário indicado não foi encontrado." in html:
             # The teacher's page is not here
             # Maybe it could be in another faculty?
+            # Network and http errors are raised as they are, only a page without the link means that the teacher doesn't exist
+            html = _cache.get_html(url = redirection_url, use_cache = use_cache)
+            link = _utils.parse_html(html).find(".//a") # This page is just a link to the right page
+
+            if link == None or link.get("href") == None:
+                self._missing_teachers.add((p_codigo, base_url))
+                raise ValueError(f"Teacher with p_codigo {p_codigo} doesn't exist")
+
+            self.url = link.get("href")
             try:
-                html = _cache.get_html(url = self.base_url + _utils.SIG_URLS["redirection page"] + "?" + _urllib.parse.urlencode({"pct_codigo" : str(p_codigo)}), use_cache = use_cache)
-                soup = _bs4.BeautifulSoup(html, "lxml")
-                self.url = soup.find("a")["href"]
                 #########################
                 if "/pt/" in self.url:
                     self.url = self.url.replace("/pt/", "/en/") # I want the page in english
@@ -87,64 +199,86 @@ class Teacher:
                 #########################
                 index = self.url.index(_utils.SIG_URLS["teacher"])
                 self.base_url = self.url[:index]
-
-                html = _cache.get_html(url = self.url, use_cache = use_cache) # Getting the html
-                soup = _bs4.BeautifulSoup(html, "lxml")
-            except:
+            except ValueError: # The link doesn't point to a teacher page
                 raise ValueError(f"Teacher with p_codigo {p_codigo} doesn't exist")
 
-        personal_info = soup.find("div", {"class" : "informacao-pessoal-dados-dados"})
+            html = _cache.get_html(url = self.url, use_cache = use_cache) # Getting the html
 
-        for row in personal_info.find_all("tr"):
-            if "Name:" in str(row):
-                self.name = row.find_all("td")[1].b.string
+            tree = _utils.parse_html(html)
+            personal_info = _PERSONAL_INFO_XPATH(tree)
 
-                if row.find("a") != None:
-                    self.personal_webpage = row.a["href"]
-            
-            elif "Acronym:" in str(row) or "Sigla:" in str(row):
-                self.acronym = row.find_all("td")[1].string
+        personal_info = personal_info[0]
+
+        rows = _rows_by_attribute(personal_info.iter("tr"), _PERSONAL_INFO_LABELS)
+
+        if "name" in rows:
+            self.name = _utils.element_string(rows["name"][1].find(".//b"))
+
+            link = rows["name"][0].getparent().find(".//a") # The link may be in any cell of the row
+            if link != None:
+                self.personal_webpage = link.get("href")
+        
+        if "acronym" in rows:
+            self.acronym = _utils.element_string(rows["acronym"][1])
+        
+        if "status" in rows:
+            self.status = _utils.element_string(rows["status"][1])
+
+        if "email" in rows:
+            email_nodes = rows["email"][0].getparent().find(".//a").xpath("node()") # The email is split in two by an image of an "@"
+            self.email = f"{email_nodes[0]}@{email_nodes[-1]}"
             
-            elif "Status:" in str(row) or "Estado:" in str(row):
-                self.status = row.find_all("td")[1].string
+        if "voip" in rows:
+            self.voip = int(_utils.element_string(rows["voip"][1]))
 
-            elif "Institutional E-mail:" in str(row) or "Email" in str(row):
-                self.email = row.a.contents[0] + "@" + row.a.contents[-1]
-                
-            elif "Voip:" in str(row):
-                self.voip = int(row.find_all("td")[1].string)
+        if "rooms" in rows:
+            self.rooms = _utils.element_string(rows["rooms"][1].find(".//a"))
 
-            elif "Rooms:" in str(row) or "Salas:" in str(row):
-                self.rooms = row.find_all("td")[1].a.string
+        self.links = tuple(str(href) for href in _LINKS_XPATH(tree))
 
-        self.links = tuple(tag["href"] for tag in soup.find("table", {"class" : "tabelasz"}).find_all("a"))
+        self._html = html # The rest of the page is parsed by _load_details, when it's needed
 
-        functions_div = soup.find("div", {"class" : "informacao-pessoal-funcoes"})
+        self._missing_teachers.discard((p_codigo, base_url)) # The page may have been refetched with use_cache = False
+        self._instances[(p_codigo, base_url)] = self
+    
+    def _load_details(self):
+        """Parses the functions and presentation sections of the teacher page"""
+        tree = _utils.parse_html(self._html)
 
-        for td in functions_div.find_all("td", {"class" : "topo"}):
+        functions_div = _FUNCTIONS_XPATH(tree)[0]
 
-            if "Department:" in str(td):
+        for td in _TOPO_XPATH(functions_div):
 
-                for row in td.find_all("tr"):
-                    if "Category:" in str(row) or "Categoria:" in str(row):
-                        self.category = row.find_all("td")[1].string
-                    
-                    elif "Career:" in str(row) or "Carreira:" in str(row):
-                        self.career = row.find_all("td")[1].string
+            if "Department:" in td.text_content():
 
-                    elif "Professional Group:" in str(row):
-                        self.profession = row.find_all("td")[1].string
-                    
-                    elif "Department:" in str(row):
-                        self.department = row.find_all("td")[1].string.strip()
+                rows = _rows_by_attribute(td.iter("tr"), _FUNCTIONS_LABELS)
+
+                if "category" in rows:
+                    self._category = _utils.element_string(rows["category"][1])
+                
+                if "career" in rows:
+                    self._career = _utils.element_string(rows["career"][1])
+
+                if "profession" in rows:
+                    self._profession = _utils.element_string(rows["profession"][1])
+                
+                if "department" in rows:
+                    self._department = _utils.element_string(rows["department"][1]).strip()
                 
                 break
             
-        
-        personal_presentation = soup.find("div", {"class" : "informacao-pessoal-apresentacao"})
+        personal_presentation = _PRESENTATION_XPATH(tree)
+
+        if len(personal_presentation) != 0:
+            self._presentation = personal_presentation[0].text_content().strip()
 
-        if personal_presentation != None:
-            self.presentation = personal_presentation.text.strip()
+        self._html = None # Only once everything was parsed, so that a failed parse raises again instead of leaving the attributes as None
+
+    category     = _lazy_attribute("category")
+    career       = _lazy_attribute("career")
+    profession   = _lazy_attribute("profession")
+    department   = _lazy_attribute("department")
+    presentation = _lazy_attribute("presentation")
     
     def picture(self) -> _PIL.Image.Image:
         """Returns a picture of the teacher as a :obj:`PIL.Image.Image` object.
@@ -176,16 +310,16 @@ class Teacher:
             print(jlopes.name)
             # João António Correia Lopes
         """        
-        matches = _re.findall(r"p_codigo=(\d+)$", url)
+        _, separator, p_codigo = url.rpartition("p_codigo=") # The p_codigo is at the end of the url
         
-        if len(matches) == 0:
+        if separator == "" or not p_codigo.isdecimal():
             raise ValueError(f"from_url() 'url' argument \"{url}\" is not a valid teacher url")
         
-        p_codigo = int(matches[0])
+        p_codigo = int(p_codigo)
 
-        matches = _re.findall(r"^https?://sigarra\.up\.pt/(\w+)/", url)
-        if len(matches) == 1:
-            base_url = f"https://sigarra.up.pt/{matches[0]}/en/"
+        match = _utils.FACULTY_REGEX.search(url)
+        if match != None:
+            base_url = f"https://sigarra.up.pt/{match.group(1)}/en/"
 
         return Teacher(p_codigo, use_cache, base_url = base_url)
     
@@ -207,47 +341,59 @@ class Teacher:
         
         return Teacher.from_url(bs4_tag["href"], use_cache, base_url = base_url)
     
+    @classmethod
+    def bulk(cls, p_codigos, use_cache : bool = True, base_url : str = "https://sigarra.up.pt/feup/en/", n_workers : int = 10):
+        """Fetches the webpages of several teachers concurrently and returns the corresponding :obj:`Teacher` objects.
+        
+        Args:
+            p_codigos (iterable(:obj:`int`)): The teachers' p_codigos
+            use_cache (:obj:`bool`, optional): Attempts to use the cache if True, otherwise it will fetch from sigarra
+            base_url (:obj:`str`, optional): The url of the faculty (in english) (defaults to "https://sigarra.up.pt/feup/en/")
+            n_workers (:obj:`int`, optional): The number of concurrent requests (defaults to 10)
+        
+        Returns:
+            A tuple of :obj:`Teacher` objects, in the same order as p_codigos
+        """
+        
+        keys = [(p_codigo, base_url) for p_codigo in p_codigos]
+        urls = [f"{base_url}{_utils.SIG_URLS['teacher']}?p_codigo={p_codigo}" for p_codigo, _ in keys]
+        
+        _cache.get_html_async(urls, n_workers, use_cache) # Refreshing the cache
+
+        return _utils.build_bulk(cls, keys, use_cache)
+    
     
     # Comparisons between teachers are made with the p_codigo
     def __eq__(self, other):
         if isinstance(other, Teacher):
             return self.p_codigo == other.p_codigo
         else:
-            return NotImplementedError
-        
-    def __gt__(self, other):
-        if isinstance(other, Teacher):
-            return self.p_codigo > other.p_codigo
-        else:
-            return NotImplementedError
+            return NotImplemented
     
-    def __ge__(self, other):
-        if isinstance(other, Teacher):
-            return self.p_codigo >= other.p_codigo
-        else:
-            return NotImplementedError
-    
-    def __lt__(self, other):
+    def __lt__(self, other): # total_ordering derives the other comparisons from this one
         if isinstance(other, Teacher):
             return self.p_codigo < other.p_codigo
         else:
-            return NotImplementedError
-    
-    def __le__(self, other):
-        if isinstance(other, Teacher):
-            return self.p_codigo <= other.p_codigo
-        else:
-            return NotImplementedError
+            return NotImplemented
     
     @property
     def __dict__(self): # This is done for compatibility reasons (vars)
-        return {attribute : getattr(self, attribute) for attribute in self.__slots__}
+        return dict(zip(self._attributes, self._ATTRIBUTES_GETTER(self)))
+
+    # Pickling support. The state is a plain tuple in _attributes order, which avoids building a dict through the __dict__ property
+    def __getstate__(self):
+        return self._ATTRIBUTES_GETTER(self)
+
+    def __setstate__(self, state):
+        for slot, value in zip(self._state_slots, state):
+            object.__setattr__(self, slot, value)
+        self._html = None # __getstate__ has already loaded the lazy attributes
 
     def __hash__(self):
         return hash(self.p_codigo)
     
     def __repr__(self):
-        if self.base_url == "https://sigarra.up.pt/feup/en/":
+        if self.base_url == _utils.DEFAULT_BASE_URL:
             return f"Teacher({self.p_codigo})"
         else:
             return f"Teacher({self.p_codigo}, base_url = {self.base_url})"
@@ -1,15 +1,27 @@
+import operator as _operator
 import re as _re
 
 import bs4 as _bs4
+from lxml import etree as _etree
 
 from . import _Credentials
 from . import _internal_utils as _utils
+from . import cache as _cache
 from . import _Course
 from . import _CurricularUnit
 from . import timetable as _timetable
 
 __all__ = ["User"]
 
+# The User pages are parsed with these XPath expressions, which are compiled only once
+_COURSE_HREF_XPATH        = _etree.XPath('(//h2[.//a[contains(@href, "cur_geral.cur_view")]])[1]/descendant::a[1]/@href')
+_CURRICULAR_UNITS_XPATH   = _etree.XPath("//" + _utils.class_xpath("tr", "d"))
+_GRADE_XPATH              = _etree.XPath(".//" + _utils.class_xpath("td", "n"))
+_UNITS_HREFS_XPATH        = _etree.XPath("//" + _utils.class_xpath("tr", "d") + "/descendant::a[1]/@href")
+_FIRST_HREF_XPATH         = _etree.XPath("(//a)[1]/@href")
+
+_PV_FEST_ID_REGEX = _re.compile(r"pv_fest_id=(\d+)")
+
 class User:
     """This class represents the information that can be extracted from your personal webpage.
     
@@ -35,25 +47,55 @@ class User:
         me = User(123456, creds)
     """
 
-    __slots__ = ["pv_fest_id", "course", "credentials"]
+    _attributes = ("pv_fest_id", "course", "credentials")
+
+    __slots__ = _attributes + ("_timetable_page_url",) # The url of the personal timetable page, built once in __init__
+
+    _ATTRIBUTES_GETTER = _operator.attrgetter(*_attributes) # Returns a tuple with the attributes' values, in _attributes order
 
     def __init__(self, pv_fest_id : int, credentials: _Credentials.Credentials):
         
         self.pv_fest_id = pv_fest_id
         self.credentials = credentials # Note, this is only a reference
 
-        html = credentials.get_html(self.credentials.base_url + _utils.SIG_URLS["courses units"], {"pv_fest_id" : str(pv_fest_id)})
-        soup = _bs4.BeautifulSoup(html, "lxml")
-        
-        if "Não tem permissões para aceder a este conteúdo." in html:
-            raise ValueError("Your Credentials object does not have permission to access the page related to this pv_fest_id")
-
-        for tag in soup.find_all("h2"):
-            if "cur_geral.cur_view" in str(tag):
-                self.course = _Course.Course.from_a_tag(tag.a)
-                break
-        else:
+        # The personal timetable page is fetched in portuguese
+        self._timetable_page_url = f"{credentials.base_url.replace('/en/', '/pt/')}{_utils.SIG_URLS['personal timetable']}?pv_fest_id={pv_fest_id}"
+
+        html = credentials.get_html(f"{credentials.base_url}{_utils.SIG_URLS['courses units']}?pv_fest_id={pv_fest_id}") # pv_fest_id is a number, there's nothing to urlencode
+
+        course_href = _COURSE_HREF_XPATH(_utils.parse_html(html))
+
+        if len(course_href) == 0:
+            # The html is only searched for the error message if no course was found
+            if "Não tem permissões para aceder a este conteúdo." in html:
+                raise ValueError("Your Credentials object does not have permission to access the page related to this pv_fest_id")
+            
             raise Exception("No course was found")
+        
+        self.course = _Course.Course.from_url(str(course_href[0]))
+
+    def prefetch(self):
+        """Fetches beforehand the pages that :func:`User.courses_units` and :func:`User.timetable` need:
+        the pages of your curricular units (concurrently, into the cache), the link to your timetable
+        and the first page of the timetable itself.
+
+        Example::
+
+            from feupy import Credentials, User
+
+            creds = Credentials()
+            me = User.from_credentials(creds)
+
+            me.prefetch()
+            me.courses_units() # The pages of the curricular units are read from the cache
+        """
+        html = self.credentials.get_html(f"{self.credentials.base_url}{_utils.SIG_URLS['courses units']}?pv_fest_id={self.pv_fest_id}") # Fetched by __init__ already
+
+        keys = [_CurricularUnit._parse_url(str(href), self.course.base_url) for href in _UNITS_HREFS_XPATH(_utils.parse_html(html))]
+        _cache.get_html_async(f"{base_url}{_utils.SIG_URLS['curricular unit']}?pv_ocorrencia_id={pv_ocorrencia_id}" for pv_ocorrencia_id, base_url in keys)
+
+        html = self.credentials.get_html(self._timetable_page_url)
+        self.credentials.get_html(str(_FIRST_HREF_XPATH(_utils.parse_html(html))[0])) # The page is just a link to the timetable
 
     def courses_units(self) -> list:
         """Returns your grades as a list of tuples.
@@ -91,21 +133,24 @@ class User:
              (CurricularUnit(419989), None),
              (CurricularUnit(419990), None)]
         """
-        html = self.credentials.get_html(self.credentials.base_url + _utils.SIG_URLS["courses units"], {"pv_fest_id" : str(self.pv_fest_id)})
-        soup = _bs4.BeautifulSoup(html, "lxml")
+        html = self.credentials.get_html(f"{self.credentials.base_url}{_utils.SIG_URLS['courses units']}?pv_fest_id={self.pv_fest_id}")
+        tree = _utils.parse_html(html)
 
-        result = []
-        for row in soup.find_all("tr", {"class" : "d"}):
-            curricular_unit = _CurricularUnit.CurricularUnit.from_a_tag(row.a)
+        hrefs = []
+        grades = []
+        for row in _CURRICULAR_UNITS_XPATH(tree):
+            hrefs.append(row.find(".//a").get("href"))
             
-            try:
-                grade = int(row.find("td", {"class" : "n"}).string)
-            except:
-                grade = None
+            grade_td = _GRADE_XPATH(row)
+            grade = _utils.element_string(grade_td[0]) if len(grade_td) != 0 else None
             
-            result.append((curricular_unit, grade))
+            grades.append(int(grade) if grade != None and grade.strip().isdecimal() else None) # Not every curricular unit has a grade
         
-        return result
+        # The curricular units' pages are fetched all at once. The relative links have the same base url as the course's,
+        # the absolute ones (the curricular units of other faculties) have their own
+        curricular_units = _CurricularUnit.CurricularUnit.from_urls(hrefs, base_url = self.course.base_url)
+
+        return list(zip(curricular_units, grades))
 
     def timetable(self) -> list:
         """Returns the current user timetable as a list of dictionaries if possible, otherwise returns None.
@@ -114,10 +159,10 @@ class User:
         Returns:
             A list of dicts
         """
-        html = self.credentials.get_html(self.credentials.base_url.replace("/en/", "/pt/") + _utils.SIG_URLS["personal timetable"], {"pv_fest_id" : str(self.pv_fest_id)})
-        soup = _bs4.BeautifulSoup(html, "lxml")
+        html = self.credentials.get_html(self._timetable_page_url)
+        timetable_url = str(_FIRST_HREF_XPATH(_utils.parse_html(html))[0]) # The page is just a link to the timetable
 
-        return _timetable.parse_current_timetable(self.credentials, soup.a["href"])
+        return _timetable.parse_current_timetable(self.credentials, timetable_url)
     
     def all_timetables(self) -> dict:
         """Parses all the timetables related to this user
@@ -129,10 +174,10 @@ class User:
             list of dictionaries (see :obj:`timetable.parse_timetable` for an example
             of such a list).
         """
-        html = self.credentials.get_html(self.credentials.base_url.replace("/en/", "/pt/") + _utils.SIG_URLS["personal timetable"], {"pv_fest_id" : str(self.pv_fest_id)})
-        soup = _bs4.BeautifulSoup(html, "lxml")
+        html = self.credentials.get_html(self._timetable_page_url)
+        timetable_url = str(_FIRST_HREF_XPATH(_utils.parse_html(html))[0]) # The page is just a link to the timetable
 
-        return _timetable.parse_timetables(self.credentials, soup.a["href"])
+        return _timetable.parse_timetables(self.credentials, timetable_url)
 
     def classes(self):
         """Returns the classes you are in as a list of tuples.
@@ -145,7 +190,7 @@ class User:
             A list of tuples
         """
         raise Warning("No idea if this works or not")
-        html = self.credentials.get_html(self.credentials.base_url + _utils.SIG_URLS["classes data"] , params = {"pv_estudante_id" : str(self.pv_fest_id)})
+        html = self.credentials.get_html(f"{self.credentials.base_url}{_utils.SIG_URLS['classes data']}?pv_estudante_id={self.pv_fest_id}")
         soup = _bs4.BeautifulSoup(html, 'lxml')
     
         tables = soup.find_all("table", {"class" : "tabela"})[1:] # Forget first table
@@ -193,10 +238,9 @@ class User:
         Returns:
             A tuple of ints
         """
-        payload = {"pv_num_unico" : str(credentials.username)}
-        html = credentials.get_html(credentials.base_url + _utils.SIG_URLS["student page"], payload)
+        html = credentials.get_html(f"{credentials.base_url}{_utils.SIG_URLS['student page']}?pv_num_unico={credentials.username}")
     
-        matches = _re.findall(r"pv_fest_id=(\d+)", html)
+        matches = _PV_FEST_ID_REGEX.findall(html)
 
         if len(matches) == 0:
             raise ValueError("No pv_fest_id's were found")
@@ -205,4 +249,4 @@ class User:
 
     @property
     def __dict__(self): # This is done for compatibility reasons (vars)
-        return {attribute : getattr(self, attribute) for attribute in self.__slots__}
+        return dict(zip(self._attributes, self._ATTRIBUTES_GETTER(self)))
@@ -1,11 +1,15 @@
 import io
 import re
+import threading
 from datetime import datetime, time
-from functools import reduce
+from time import monotonic
 
 import bs4
 import requests
 from bs4 import BeautifulSoup
+from bs4.builder import LXMLTreeBuilder
+from lxml import etree
+from lxml.html import HTMLParser, document_fromstring
 from lxml.html.clean import Cleaner
 from PIL import Image
 
@@ -37,6 +41,10 @@ SIG_URLS = {
     "redirection page"                    : "vld_entidades_geral.entidade_pagina"
 }
 
+FACULTY_REGEX = re.compile(r"^https?://sigarra\.up\.pt/(\w+)/") # e.g. matches "https://sigarra.up.pt/feup/" and captures "feup"
+
+DEFAULT_BASE_URL = "https://sigarra.up.pt/feup/en/" # The base_url every class defaults to
+
 BASE_URLS = [
     "https://sigarra.up.pt/flup/en/",
     "https://sigarra.up.pt/feup/en/",
@@ -47,14 +55,25 @@ BASE_URLS = [
     "https://sigarra.up.pt/faup/en/",
 ]
 
+_academic_year_cache = (float("-inf"), None) # (monotonic() of the last computation, academic year)
+
 def get_current_academic_year():
+    global _academic_year_cache
+
+    computed_at, academic_year = _academic_year_cache
+    if monotonic() - computed_at < 3600: # The academic year only changes once a year, an hour old value is fine
+        return academic_year
+
     today = datetime.now()
     if today.month >= 9:# 9 -> September
-        return today.year
+        academic_year = today.year
     else:
-        return today.year - 1
+        academic_year = today.year - 1
+    
+    _academic_year_cache = (monotonic(), academic_year)
+    return academic_year
 
-def scrape_html_table(bs_table, f = lambda tags_list, index : list( map(lambda tag: tag.string, tags_list) )):
+def scrape_html_table(bs_table, f = None):
     """
     Returns a nested list based on the contents of the table
 
@@ -94,12 +113,15 @@ def scrape_html_table(bs_table, f = lambda tags_list, index : list( map(lambda t
     if type(bs_table) != bs4.element.Tag:
         raise TypeError("scrape_html_table() 'bs_table' argument must be a bs4.element.Tag, not '{0}'".format( type(bs_table).__name__ ))
 
-    if type(f).__name__ != "function": # Look, it works:/
+    if f != None and not callable(f):
         raise TypeError("scrape_html_table() 'f' argument must be a function, not '{0}'".format( type(f).__name__ ))
     
     if bs_table.name != "table" and bs_table.name != "thead" and bs_table.name != "tbody":
         raise ValueError("The tag element must be a table, not '{0}'".format(bs_table.name))
 
+    if f == None: # Fast path, no function calls per cell
+        return [[tag.string for tag in tr.find_all(["th", "td"], recursive = False)] for tr in bs_table.find_all("tr", recursive = False)]
+
     result = []
     for index, tr in enumerate(bs_table.find_all("tr", recursive = False)):  # split the table into table rows
         tags = tr.find_all(["th", "td"], recursive = False)                  # split the table row into table header and data tags
@@ -107,18 +129,75 @@ def scrape_html_table(bs_table, f = lambda tags_list, index : list( map(lambda t
     
     return result
 
-def trim_html(html):
-    """Takes a html string as input and returns the html without any styles nor javascript"""
-    cleaner = Cleaner()
+_builders = threading.local() # One lxml tree builder per thread, a builder can't be shared by two soups being built at the same time
+
+def make_soup(html, parse_only = None):
+    """Equivalent to ``BeautifulSoup(html, "lxml", parse_only = parse_only)``, except that
+    the lxml tree builder is created once (per thread) and then reused, instead of being
+    looked up and instantiated every time a soup is made"""
+    try:
+        builder = _builders.lxml
+    except AttributeError:
+        builder = _builders.lxml = LXMLTreeBuilder()
+
+    return BeautifulSoup(html, builder = builder, parse_only = parse_only)
+
+_parsers = threading.local() # One lxml html parser per thread as well, for the same reason
+
+def html_parser(remove_comments = False):
+    """Returns this thread's lxml html parser, which is created on the first call and then reused.
+    If remove_comments is True, the parser drops the comments and processing instructions while parsing"""
+    name = "without_comments" if remove_comments else "default"
+    parser = getattr(_parsers, name, None)
+
+    if parser == None:
+        parser = HTMLParser(remove_comments = remove_comments, remove_pis = remove_comments, collect_ids = False) # The pages are never searched by xml:id
+        setattr(_parsers, name, parser)
 
-    cleaner.scripts         = True
-    cleaner.javascript      = True  # Get rid of the javascript and the style
-    cleaner.style           = True
+    return parser
 
-    cleaner.meta            = False # Keeping the meta tags is important for page redirection purposes
-    cleaner.safe_attrs_only = False
+def parse_html(html, remove_comments = False):
+    """Parses the html string with lxml and returns the root element of the document (an :obj:`lxml.html.HtmlElement`).
+    Use this instead of :func:`make_soup` when the page is only read through (preferably precompiled) XPath expressions"""
+    return document_fromstring(html, parser = html_parser(remove_comments))
 
-    return cleaner.clean_html(html)
+def class_xpath(tag_name, class_name):
+    """Returns an XPath step that matches the tag_name elements that have class_name
+    as one of their classes, which is what ``soup.find_all(tag_name, {"class" : class_name})`` matches
+    Eg: class_xpath("div", "horas") -> 'div[contains(concat(" ", normalize-space(@class), " "), " horas ")]'
+    """
+    return f'{tag_name}[contains(concat(" ", normalize-space(@class), " "), " {class_name} ")]'
+
+def element_string(element):
+    """The lxml counterpart of bs4's ``Tag.string``: if the element has a single child node, returns
+    that child's string (recursively), otherwise returns None"""
+    while True:
+        nodes = element.xpath("node()")
+
+        if len(nodes) != 1:
+            return None
+
+        if not isinstance(nodes[0], etree._Element):
+            return str(nodes[0]) # A plain str doesn't keep the whole tree alive, unlike lxml's "smart" strings
+
+        element = nodes[0]
+
+_cleaner = Cleaner(
+    scripts         = True,
+    javascript      = True,  # Get rid of the javascript and the style
+    style           = True,
+
+    meta            = False, # Keeping the meta tags is important for page redirection purposes
+    safe_attrs_only = False
+) # Created once, trim_html doesn't need a new one every time
+
+def trim_html(html):
+    """Takes a html string as input and returns the html without any styles nor javascript"""
+    return _cleaner.clean_html(html)
+
+def trim_element(element):
+    """In-place version of :func:`trim_html`, for an lxml element that has already been parsed"""
+    _cleaner(element)
 
 def parse_academic_year(html):
     """Searches the html for r"(\\d\\d\\d\\d)/\\d\\d\\d\\d" and returns the
@@ -138,11 +217,25 @@ def parse_date(date : str) -> datetime:
 
     return datetime(year, month, day, hour, minute)
 
+def build_bulk(cls, keys, use_cache):
+    """Returns ``cls(id, base_url = base_url)`` for each (id, base_url) in keys, in the same order.
+    Shared by the bulk constructors of the feupy classes, which refresh the pages in the cache beforehand.
+
+    cls must implement the ``_forget(key)`` classmethod. If use_cache is False, every key is forgotten first,
+    so that the objects are parsed from the refreshed pages instead of being reused"""
+    if not use_cache:
+        for key in keys:
+            cls._forget(key)
+    
+    return tuple(cls(id, base_url = base_url) for id, base_url in keys)
+
+_session = requests.Session() # Reused by get_image, so that consecutive images are fetched over the same connection
+
 def get_image(url, params = None):
     """Fetches the image from the url and returns it as a PIL.Image object.
     If you need to be logged in to access the image you may want to check
     out the Credentials get_image function"""
-    request = requests.get(url, params)
+    request = _session.get(url, params = params)
     image = Image.open(io.BytesIO(request.content))
 
     return image
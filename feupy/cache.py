@@ -4,122 +4,177 @@ Attributes:
     cache (:obj:`shelve.DbfilenameShelf` or None (Initially, see :func:`load_cache`)): A persistent dictionary-like object whose values are structured in the following way:
         
         | {
-        |     url0 : (timeout0, html0),
-        |     url1 : (timeout1, html1),
+        |     url0 : (timeout0, html0, etag0, last_modified0, unchanged0),
+        |     url1 : (timeout1, html1, etag1, last_modified1, unchanged1),
         |     ...
         | }
 
-        In which url is a string, timeout is an int or a float (which represents the "due by date" as seconds since epoch), and html is a string
+        In which url is a string, timeout is an int or a float (which represents the "due by date" as seconds since epoch), html is
+        the html string compressed with :func:`zlib.compress` (see :func:`get_html` for the decompressed html) and etag and
+        last_modified are the ``ETag`` and ``Last-Modified`` headers of the response (or None), used to revalidate outdated entries.
+        unchanged is the number of times in a row that an outdated entry turned out to be unchanged.
+        The cache also has a "format version" key, see :func:`load_cache`
 
 """
 import atexit as _atexit
+import collections as _collections
+import concurrent.futures as _futures
 import datetime as _datetime
+import math as _math
 import os as _os
 import random as _random
 import re as _re
 import shelve as _shelve
+import threading as _threading
 import time as _time
 import urllib as _urllib
+import zlib as _zlib
 
-import bs4 as _bs4
+import lxml.html as _lxml_html
 import requests as _requests
 import requests_futures.sessions as _sessions
+from lxml import etree as _etree
 
 from . import _internal_utils as _utils
 
 __all__ = ["load_cache", "get_html", "reset", "remove_invalid_entries", "get_html_async"]
 
 cache = None # This will eventually be the cache object
+
+_FORMAT_VERSION_KEY = "format version" # Not a url, so it never clashes with an entry
+_FORMAT_VERSION = 2 # 1 was the (timeout, html) tuples
 # The cache is a dictionary-like object whose values are structured in the following way:
 # {
-#     url0 : (timeout0, html0),
-#     url1 : (timeout1, html1),
+#     url0 : (timeout0, html0, etag0, last_modified0, unchanged0),
+#     url1 : (timeout1, html1, etag1, last_modified1, unchanged1),
 #     ...
 # }
-# In which url is a string, timeout is an int or a float (which represents the "due by date" as seconds since epoch), and html is a string
+# In which url is a string, timeout is an int or a float (which represents the "due by date" as seconds since epoch), html is a string
+# compressed with zlib and etag and last_modified are the validators sent by sigarra, if any. unchanged is the number of times
+# in a row that the entry was revalidated
+#
+# The cache also stores _FORMAT_VERSION under _FORMAT_VERSION_KEY. Whenever the structure above changes, _FORMAT_VERSION
+# is incremented, so that load_cache discards the cache files written by older versions of feupy instead of misreading them
+#
+# When an entry times out, it is revalidated with a conditional GET. If sigarra answers with 304 Not Modified,
+# only the timeout is refreshed (see _new_timeout), and the html is neither downloaded nor treated again.
+# Each time this happens, the half-life of the entry's timeout doubles (see _adapted_half_life), so that pages that
+# never change are revalidated less and less often. When the page does change, the half-life goes back to normal
 #
 # When get_html is called, if the url is not in the cache keys (or the key is present but the cache entry is outdated),
-# get_html will first check if the url matches any key in custom_treatments (it matches if key(url) returns True).
-# If so the cache will call custom_treatments[key](html), instead of default_treatment(html)
+# get_html will first search the url with _URL_KIND_REGEX. If it matches, the cache will call
+# _custom_treatments[match.lastgroup](html), instead of default_treatment(html)
 #
 # This behaviour was implemented so that commonly accessed pages (curricular units, students, teachers)
 # can have their htmls even more shrinked than usual (by returning a timeout and the div with the useful information)
 
 _custom_treatments = {}
 
+# The most recently used entries are also kept in memory, decompressed, so that hits don't need to touch the disk
+_hot_entries = _collections.OrderedDict()
+_HOT_ENTRIES_MAX = 256
 
-############################### Custom treatments ################################
+# The timeouts of the entries that were read or written so far, so that checking whether an entry is
+# valid doesn't require reading (and unpickling) the whole html from the cache again
+_timeouts = {}
 
-def _is_curricular_unit(url):
-    return "ucurr_geral.ficha_uc_view" in url 
+_MAX_HALF_LIFE = _datetime.timedelta(days = 365) # No matter how many times a page was unchanged, it is revalidated at least every few years
 
-def _is_teacher(url):
-    return "func_geral.formview" in url
+# Shared by get_html and get_html_async, so that the connections to sigarra are kept alive between requests
+_session = _requests.Session()
 
-def _is_student(url):
-    return "fest_geral.cursos_list" in url
+# The urls being fetched by get_html_async, mapped to a future that is done once their entries are in the cache.
+# Concurrent calls wait for it instead of fetching the same url again
+_inflight = {}
 
-def _trim_curricular_unit(html):
-    """Returns a heavily trimmed version of the curricular unit html"""
-    html = _utils.trim_html(html)
+# get_html and get_html_async may be called from several threads at once, so every read and write of the cache,
+# _hot_entries, _timeouts and _inflight is done while holding this lock. It is reentrant because the helpers below
+# that take it call each other. The network requests are never made while holding it
+_lock = _threading.RLock()
 
-    soup = _bs4.BeautifulSoup(html, "lxml")
 
-    useful_stuff = soup.find("div", {"id" : "envolvente"})
+############################### Custom treatments ################################
 
-    useful_stuff.find("div", {"id" : "colunaprincipal"}).decompose() # Remove the left side-bar
+# Each named group identifies a kind of page with a custom treatment, see _custom_treatments
+_URL_KIND_REGEX = _re.compile(r"(?P<curricular_unit>ucurr_geral\.ficha_uc_view)|(?P<teacher>func_geral\.formview)|(?P<student>fest_geral\.cursos_list)")
 
-    return str(useful_stuff)
+_DIV_BY_ID_XPATH = _etree.XPath("//div[@id = $div_id]") # Compiled only once, the id is passed as a variable
 
-def _trim_teacher(html):
-    """Returns a heavily trimmed version of the teacher html"""
-    html = _utils.trim_html(html)
+def _trim_to_div(html, div_id, removed_div_id = None):
+    """Returns only the div with the id div_id (without the div with the id removed_div_id, if given),
+    without any scripts nor styles. If the div is not in the html, the whole trimmed html is
+    returned, so that error messages can still be found in it"""
+    tree = _utils.parse_html(html, remove_comments = True) # The comments are dropped while parsing, as trim_html would
+    useful_stuff = _DIV_BY_ID_XPATH(tree, div_id = div_id)
+
+    if len(useful_stuff) == 0:
+        _utils.trim_element(tree)
+        return _lxml_html.tostring(tree, encoding = "unicode")
+    
+    useful_stuff = useful_stuff[0]
 
-    soup = _bs4.BeautifulSoup(html, "lxml")
+    if removed_div_id != None:
+        for div in _DIV_BY_ID_XPATH(useful_stuff, div_id = removed_div_id):
+            div.drop_tree()
+    
+    _utils.trim_element(useful_stuff) # Only the div is cleaned, instead of the whole page
+    
+    return _lxml_html.tostring(useful_stuff, encoding = "unicode", with_tail = False)
 
-    useful_stuff = soup.find("div", {"id" : "conteudo"})
+def _trim_curricular_unit(html):
+    """Returns a heavily trimmed version of the curricular unit html"""
+    return _trim_to_div(html, "envolvente", "colunaprincipal") # Remove the left side-bar
 
-    return str(useful_stuff)
+def _trim_teacher(html):
+    """Returns a heavily trimmed version of the teacher html"""
+    return _trim_to_div(html, "conteudo")
 
 def _trim_student(html):
     """Returns a heavily trimmed version of the student html"""
-    html = _utils.trim_html(html)
+    return _trim_to_div(html, "conteudo-extra")
 
-    soup = _bs4.BeautifulSoup(html, "lxml")
+def _curricular_unit_timeout(unchanged = 0):
+    half_life = _adapted_half_life(_datetime.timedelta(days = 6*30), unchanged) # It is extremely unlikely that a uc page from a previous year will ever change
+    return _time.time() + _random_radioactive_lifetime(half_life)
 
-    useful_stuff = soup.find("div", {"id" : "conteudo-extra"})
+def _teacher_timeout(unchanged = 0):
+    return _time.time() + _random_radioactive_lifetime(_adapted_half_life(_datetime.timedelta(days = 2*30), unchanged))
 
-    return str(useful_stuff)
+def _student_timeout(unchanged = 0):
+    year  = _utils.get_current_academic_year() + 1
+    return _datetime.datetime(year, 9, 20).timestamp() # Only update at the beginning of the next academic year
 
 def _curricular_unit_treatment(html):
-    timeout = _time.time() + _random_radioactive_lifetime(_datetime.timedelta(days = 6*30)) # It is extremely unlikely that a uc page from a previous year will ever change
+    timeout = _curricular_unit_timeout()
+    trimmed_html = _trim_curricular_unit(html)
     
     try:
         #If this fails, it's probably a uc from another faculty
-        uc_academic_year = _utils.parse_academic_year(html)
+        _utils.parse_academic_year(trimmed_html)
     except IndexError:
-        return (timeout, html)
+        return (timeout, trimmed_html) # Without the div, _trim_to_div already kept the whole page, just without scripts nor styles
 
-    if uc_academic_year < _utils.get_current_academic_year():
-        return (timeout, _trim_curricular_unit(html))
-    else:
-        return (timeout, _trim_curricular_unit(html))
+    return (timeout, trimmed_html)
 
 def _teacher_treatment(html):
-    timeout = _time.time() + _random_radioactive_lifetime(_datetime.timedelta(days = 2*30))
-    return (timeout, _trim_teacher(html))
+    return (_teacher_timeout(), _trim_teacher(html))
 
 def _student_treatment(html):
-    year  = _utils.get_current_academic_year() + 1
-    timeout = _datetime.datetime(year, 9, 20).timestamp() # Only update at the beginning of the next academic year
-    return (timeout, _trim_student(html))
+    return (_student_timeout(), _trim_student(html))
 
 ############################ End of custom treatments ############################
 
 _custom_treatments = {
-    _is_curricular_unit : _curricular_unit_treatment,
-    _is_teacher         : _teacher_treatment,
-    _is_student         : _student_treatment
+    "curricular_unit" : _curricular_unit_treatment,
+    "teacher"         : _teacher_treatment,
+    "student"         : _student_treatment
+}
+
+# The timeouts given by the custom treatments, used when an outdated entry turns out to be unchanged
+_custom_timeouts = {
+    "curricular_unit" : _curricular_unit_timeout,
+    "teacher"         : _teacher_timeout,
+    "student"         : _student_timeout
 }
 
 def load_cache(flag = "c", path = None):
@@ -131,6 +186,10 @@ def load_cache(flag = "c", path = None):
         path (:obj:`str` or :obj:`None`, optional): The path of the directory where the cache is stored.
             It defaults to this file's folder path
     
+    Note:
+        If the cache on disk was written by an older version of feupy, whose entries have a different
+        structure, its entries are discarded (unless the flag is "r", in which case a ValueError is raised)
+
     Note:
         Unless you intend to call :func:`load_cache` with non-default arguments,
         you don't have to call this function. The other functions in this module
@@ -151,7 +210,18 @@ def load_cache(flag = "c", path = None):
     if path == None:
         path = _os.path.dirname(__file__)
     
-    cache = _shelve.open(_os.path.join(path, "cache"), flag = flag, writeback = True)
+    # No writeback: the values are only ever replaced, never mutated in place, so there is no need to keep
+    # every entry that was read in memory (and to write all of them back to disk on close)
+    cache = _shelve.open(_os.path.join(path, "cache"), flag = flag)
+
+    if cache.get(_FORMAT_VERSION_KEY) != _FORMAT_VERSION:
+        if flag == "r":
+            cache.close()
+            cache = None
+            raise ValueError("The cache was written by an older version of feupy and can't be discarded with the flag 'r'")
+
+        cache.clear()
+        cache[_FORMAT_VERSION_KEY] = _FORMAT_VERSION
     
     _atexit.register(cache.close) # This function will be called at program termination, in order to make sure that the cache is saved to disk
     # the cache object itself would most likely close itself on exit, but better be safe than sorry
@@ -171,17 +241,126 @@ def _random_radioactive_lifetime(half_life = _datetime.timedelta(days=2), cutoff
 
     return min(lifetime, half_life * 4) if cutoff else lifetime
 
+def _adapted_half_life(half_life, unchanged):
+    """Returns the half-life doubled for each time the entry turned out to be unchanged, up to _MAX_HALF_LIFE"""
+    return min(half_life * 2**unchanged, _MAX_HALF_LIFE)
+
+def _default_timeout(unchanged = 0):
+    return _time.time() + _random_radioactive_lifetime(_adapted_half_life(_datetime.timedelta(days = 2), unchanged))
+
 def _default_treatment(html):
     """The default treatment for any url that doesn't match any key in custom_treatments.
     Returns a tuple made of a timeout provided by random_radioactive_lifetime and the html
     without any scripts nor styles, to save space"""
 
-    return (_time.time() + _random_radioactive_lifetime(), _utils.trim_html(html))
+    return (_default_timeout(), _utils.trim_html(html))
 
-def _cache_entry_is_valid(key):
-    """Returns True if the cache entry is valid, otherwise returns false"""
-    global cache
-    return cache[key][0] > _time.time()
+def _treat(url, html):
+    """Returns the cache entry for the url's html, made by the custom treatment
+    that matches the url or by the default treatment if none does"""
+    match = _URL_KIND_REGEX.search(url) # Can we apply any custom treatment to the html?
+
+    if match != None:
+        return _custom_treatments[match.lastgroup](html)
+    
+    return _default_treatment(html)     # If not, use the default treatment
+
+def _new_timeout(url, unchanged):
+    """Returns a new timeout for the url's entry, as its treatment would if the entry had been unchanged for that many times in a row"""
+    match = _URL_KIND_REGEX.search(url)
+
+    if match != None:
+        return _custom_timeouts[match.lastgroup](unchanged)
+    
+    return _default_timeout(unchanged)
+
+def _compress(entry, headers = None):
+    """Takes a (timeout, html) tuple and the headers of the response and returns the tuple that is stored in the cache.
+    The htmls are very repetitive, so compressing them makes the cache a lot smaller (and quicker to read from disk)"""
+    timeout, html = entry
+    headers = headers if headers != None else {}
+    compressed_html = _zlib.compress(html.encode("utf-8"), 3) # Level 3 is much faster than the default, and almost as good
+
+    return (timeout, compressed_html, headers.get("ETag"), headers.get("Last-Modified"), 0) # New html, so it hasn't been unchanged yet
+
+def _conditional_headers(stored_entry):
+    """Returns the headers that turn the request of an outdated cache entry (as stored in the cache, or None) into a conditional GET"""
+    headers = {}
+
+    if stored_entry == None:
+        return headers
+    
+    etag, last_modified = stored_entry[2:4]
+
+    if etag != None:
+        headers["If-None-Match"] = etag
+    
+    if last_modified != None:
+        headers["If-Modified-Since"] = last_modified
+    
+    return headers
+
+def _refresh(url, stored_entry):
+    """Returns the entry stored in the cache with a new (longer) timeout, for when sigarra says that the page hasn't changed"""
+    unchanged = stored_entry[4] + 1
+    return (_new_timeout(url, unchanged),) + stored_entry[1:4] + (unchanged,)
+
+def _decompress(html):
+    """The inverse of :func:`_compress` for the html of a cache entry"""
+    return _zlib.decompress(html).decode("utf-8")
+
+def _timeout_of(key):
+    """Returns the timeout of the cache entry. The entry is only read from the cache if its timeout isn't in _timeouts yet"""
+    with _lock:
+        timeout = _timeouts.get(key)
+
+        if timeout == None:
+            timeout = _timeouts[key] = cache[key][0]
+    
+    return timeout
+
+def _store(key, stored_entry):
+    """Stores the entry (as returned by :func:`_compress` or :func:`_refresh`) in the cache"""
+    with _lock:
+        cache[key] = stored_entry
+        _timeouts[key] = stored_entry[0]
+
+def _remember(key, entry):
+    """Stores the (timeout, decompressed html) entry in _hot_entries, forgetting the least recently used one if it's full"""
+    with _lock:
+        _hot_entries[key] = entry
+        _hot_entries.move_to_end(key)
+
+        if len(_hot_entries) > _HOT_ENTRIES_MAX:
+            _hot_entries.popitem(last = False)
+
+def _get_valid_entry(key):
+    """Returns the cache entry, with the html decompressed, if it's present and valid, otherwise returns None.
+    The entry is looked up in _hot_entries first, and is only read (and unpickled) once from the cache"""
+    with _lock:
+        entry = _hot_entries.get(key)
+
+        if entry != None:
+            if entry[0] > _time.time():
+                _hot_entries.move_to_end(key)
+                return entry
+            
+            del _hot_entries[key]
+        
+        if _timeouts.get(key, _math.inf) <= _time.time(): # Known to be outdated, no need to read it
+            return None
+
+        entry = cache.get(key)
+
+        if entry != None:
+            _timeouts[key] = entry[0]
+
+    if entry != None and entry[0] > _time.time():
+        entry = (entry[0], _decompress(entry[1]))
+        _remember(key, entry)
+        return entry
+    
+    return None
 
 def get_html(url, params = {}, use_cache = True):
     """More or less functionally equivalent to ``requests.get(url, params).text``, with the added
@@ -208,38 +387,47 @@ def get_html(url, params = {}, use_cache = True):
         If you know that you are going to make a crapton of requests beforehand, you probably
         should call :func:`get_html_async` first to populate the cache.
     """
-    global cache
-
     if cache == None:
         load_cache()
     
     if params != {}:
         url = url + "?" + _urllib.parse.urlencode(params, doseq = True) # Emulating the RequestsIII library
     
-    if url in cache and _cache_entry_is_valid(url) and use_cache:
-        pass
-    else: # We need to get the page from the web
-        request = _requests.get(url) # Getting the webpage
-        request.raise_for_status()  # If the request fails, I want to know about it
-        html = request.text
-
-        for match_rule, custom_treatment in _custom_treatments.items(): # Can we apply any custom treatment to the html?
-            if match_rule(url):
-                cache[url] = custom_treatment(html)
-                break
-        else:                                                         # If not, use the default treatment
-            cache[url] = _default_treatment(html)
+    entry = _get_valid_entry(url) if use_cache else None
+
+    if entry != None:
+        return entry[1]
+    
+    # We need to get the page from the web
+    with _lock:
+        stored_entry = cache.get(url) if use_cache else None
+
+    request = _session.get(url, headers = _conditional_headers(stored_entry)) # Getting the webpage
+    request.raise_for_status()  # If the request fails, I want to know about it
+
+    if request.status_code == 304: # Not modified, the outdated entry is still good
+        stored_entry = _refresh(url, stored_entry)
+        entry = (stored_entry[0], _decompress(stored_entry[1]))
+        _store(url, stored_entry)
+        _remember(url, entry)
+        return entry[1]
     
-    return cache[url][1]
+    entry = _treat(url, request.text) # Decoded by requests, which honours the charset of the Content-Type header
+    _store(url, _compress(entry, request.headers))
+    _remember(url, entry)
+    
+    return entry[1]
 
 def reset():
     """Eliminates all entries from the cache"""
-    global cache
-
     if cache == None:
         load_cache()
 
-    cache.clear()
+    with _lock:
+        cache.clear()
+        cache[_FORMAT_VERSION_KEY] = _FORMAT_VERSION
+        _hot_entries.clear()
+        _timeouts.clear()
 
 def remove_invalid_entries(urls = None):
     """Removes all the cache entries in urls that have timed out.
@@ -249,22 +437,20 @@ def remove_invalid_entries(urls = None):
             is left untouched, all urls in the cache will be checked
     
     """
-    global cache
-
     if cache == None:
         load_cache()
 
-    if urls == None:
-        urls = cache.keys()
-    
-    hit_list = set() # Each element must be unique, otherwise it will be popped twice
-
-    for url in urls:
-        if url in cache and not _cache_entry_is_valid(url):
-            hit_list.add(url)
-    
-    for url in hit_list:
-        cache.pop(url)
+    with _lock:
+        if urls == None:
+            urls = [url for url in cache.keys() if url != _FORMAT_VERSION_KEY]
+        
+        now = _time.time()
+        hit_list = {url for url in urls if url in cache and _timeout_of(url) <= now} # Each element must be unique, otherwise it will be popped twice
+        
+        for url in hit_list:
+            cache.pop(url)
+            _hot_entries.pop(url, None)
+            _timeouts.pop(url, None)
 
 def get_html_async(urls, n_workers = 10, use_cache = True):
     """:func:`get_html`, but async, give or take.
@@ -280,36 +466,61 @@ def get_html_async(urls, n_workers = 10, use_cache = True):
     Returns:
       An str generator
     """
-    global cache
-
     if cache == None:
         load_cache()
 
     urls = tuple(urls)
 
-    remove_invalid_entries(urls)
+    # Outdated entries don't need to be removed first, they are overwritten by the new ones.
+    # Repeated urls are only fetched once
+    work_queue = list(dict.fromkeys(url for url in urls if not use_cache or _get_valid_entry(url) == None))
 
-    work_queue = [url for url in urls if url not in cache or not use_cache]
+    with _lock:
+        borrowed = {_inflight[url] for url in work_queue if url in _inflight} # Already being fetched by someone else
+        work_queue = [url for url in work_queue if url not in _inflight]
+
+        done = _futures.Future()
+        _inflight.update((url, done) for url in work_queue)
 
     if len(work_queue) > 0:
-        with _sessions.FuturesSession(max_workers = n_workers) as session:
+        entries = {}
+
+        try:
+            _fetch_entries(work_queue, entries, n_workers, use_cache)
+        finally:
+            with _lock:
+                cache.update(entries) # All the entries are stored at once, after the network work is done
+                _timeouts.update((url, entry[0]) for url, entry in entries.items())
+
+                for url in work_queue:
+                    _inflight.pop(url, None)
             
-            futures = [session.get(url) for url in work_queue]
-
-            for future in futures:
-                request = future.result()
-
-                if request.status_code != 200:
-                    continue # GTFO
-                
-                url  = request.url
-                html = request.text
-
-                for match_rule, custom_treatment in _custom_treatments.items(): # Can we apply any custom treatment to the html?
-                    if match_rule(url):
-                        cache[url] = custom_treatment(html)
-                        break
-                else:                                                         # If not, use the default treatment
-                    cache[url] = _default_treatment(html)
+            done.set_result(None)
+    
+    _futures.wait(borrowed)
     
     return (get_html(url) for url in urls)
+
+def _fetch_entries(work_queue, entries, n_workers, use_cache):
+    """Fetches the urls in work_queue and puts their cache entries (as they are stored in the cache) in the entries dict"""
+    with _sessions.FuturesSession(max_workers = n_workers, session = _session) as session:
+        
+        with _lock:
+            stored_entries = {url : cache.get(url) for url in work_queue} if use_cache else {}
+
+        futures = {session.get(url, headers = _conditional_headers(stored_entries.get(url))) : url for url in work_queue}
+
+        for future in _futures.as_completed(futures): # The htmls are treated while the other requests are still running
+            request = future.result()
+
+            if request.status_code == 304: # Not modified, only the timeout needs to be refreshed
+                url = futures[future]
+                entries[url] = _refresh(url, stored_entries[url])
+                continue
+
+            if request.status_code != 200:
+                continue # GTFO
+            
+            entries[request.url] = _compress(_treat(request.url, request.text), request.headers)
+            with _lock:
+                _hot_entries.pop(request.url, None) # The old version of the entry, if there is one in memory
@@ -1,12 +1,27 @@
 import datetime as _datetime
+import itertools as _itertools
+import re as _re
+import sys as _sys
 
-import bs4 as _bs4
+from lxml import etree as _etree
 
 from . import cache as _cache
 from . import _CurricularUnit
+from . import _internal_utils as _utils
 
 __all__ = ["exams"]
 
+# The exam pages are parsed with these XPath expressions, which are compiled only once
+_EXAM_HREFS_XPATH = _etree.XPath('//div[@id = "conteudoinner"]//a[contains(@href, "exa_geral.exame_view")]/@href')
+_EXAM_ROWS_XPATH  = _etree.XPath('(//div[@id = "conteudoinner"]//table)[1]//tr')
+_CELLS_XPATH      = _etree.XPath(".//td")
+_VALUE_XPATH      = _etree.XPath("string((.//td)[2])", smart_strings = False) # The whole text of the row's second cell, in a single call
+_HREF_XPATH       = _etree.XPath("string((.//a)[1]/@href)", smart_strings = False)
+_ROOMS_XPATH      = _etree.XPath(".//a/text()", smart_strings = False)
+
+_START_REGEX = _re.compile(r"(\d{4})-(\d{2})-(\d{2}) +(\d{1,2}):(\d{2})") # yyyy-mm-dd hh:mm
+_TIME_REGEX  = _re.compile(r"(\d{1,2}):(\d{2})")                           # hh:mm
+
 def exams(url : str, use_cache : bool = True, base_url : str = "https://sigarra.up.pt/feup/en/") -> list:
     """Returns a list of dictionaries.
 
@@ -93,54 +108,63 @@ def exams(url : str, use_cache : bool = True, base_url : str = "https://sigarra.
         'start': datetime.datetime(2019, 9, 26, 13, 30)}]
     """
     html = _cache.get_html(url, use_cache = use_cache)
-    soup = _bs4.BeautifulSoup(html, 'lxml')
-    content = soup.find("div", {"id" : "conteudoinner"})
 
-    tags = [tag for tag in content.find_all("a")]
-    tags.pop(0)
+    hrefs = _EXAM_HREFS_XPATH(_utils.parse_html(html)) # Only the links to exams are selected
 
-    urls = [base_url.replace("/en/", "/pt/") + tag["href"] for tag in tags if "exa_geral.exame_view" in tag["href"]]
-    _cache.get_html_async(urls, use_cache = use_cache) # Refresh the cache
-    return [_parse_exam_page(url) for url in urls]
+    pt_base_url = base_url.replace("/en/", "/pt/") # The exam pages are in portuguese
+    urls = [pt_base_url + href for href in hrefs]
+    htmls = _cache.get_html_async(urls, use_cache = use_cache) # Refresh the cache and get the htmls in one go
+    result = [_parse_exam_page(html) for html in htmls]
 
-def _parse_exam_page(url : str):
-    """Parses an exam page from the url and returns a dictionary"""
+    # The curricular units' pages are also fetched all at once, instead of one by one
+    curricular_units = _CurricularUnit.CurricularUnit.from_urls([exam["curricular unit"] for exam in result])
 
-    html = _cache.get_html(url)
-    soup = _bs4.BeautifulSoup(html, 'lxml')
-    content = soup.find("div", {"id" : "conteudoinner"})
-    table = content.find("table")
+    for exam, curricular_unit in zip(result, curricular_units):
+        exam["curricular unit"] = curricular_unit
+    
+    return result
 
-    rows = table.find_all("tr")
+def _parse_exam_page(html):
+    """Parses the html of an exam page, see :func:`_parse_exam_tree`"""
+    return _parse_exam_tree(_utils.parse_html(html, remove_comments = True)) # The comments would only get in the way
 
-    code, _, season, date, start, length = rows[:6]
+def _parse_exam_tree(tree):
+    """Parses the already parsed html of an exam page and returns a dictionary, in which
+    "curricular unit" is still the url of the curricular unit (see :func:`exams`)"""
 
-    curricular_unit = _CurricularUnit.CurricularUnit.from_a_tag(code.a)
+    rows = _EXAM_ROWS_XPATH(tree)
 
-    season = season.find_all("td")[1].string
+    curricular_unit = _HREF_XPATH(rows[0])
 
-    year, month, day = map(int, date.find_all("td")[1].string.split("-"))
+    _, _, season, date, start, length = (_VALUE_XPATH(row) for row in rows[:6])
 
-    start_hour, start_minute = map(int, start.find_all("td")[1].string.split(":"))
+    season = _sys.intern(season) if season else None # There are only a handful of different seasons, so they can share the same strings
 
-    start = _datetime.datetime(year, month, day, start_hour, start_minute)
+    start = _datetime.datetime(*map(int, _START_REGEX.match(f"{date.strip()} {start.strip()}").groups())) # The date and the start time are parsed in one go
 
-    try:
-        length_hour, length_minute = map(int, length.find_all("td")[1].string.split(":"))
+    length = _TIME_REGEX.search(length)
+
+    if length != None:
+        length_hour, length_minute = map(int, length.groups())
 
         delta = _datetime.timedelta(hours = length_hour, minutes = length_minute)
 
         finish = start + delta
-
-    except AttributeError:
+    else:
         finish = None
 
     rooms = observations = None
-    for row in rows[6:]:
-        if "Salas:" in str(row):
-            rooms = tuple(tag.string for tag in row.find_all("a"))
-        elif "Observações:" in str(row):
-            observations = row.find_all("td")[1].string
+    for row in _itertools.islice(rows, 6, None): # No need to copy the rest of the rows
+        cells = _CELLS_XPATH(row)
+        label = cells[0].text_content() if len(cells) > 0 else "" # Only the first cell has the label, the rest of the row doesn't need to be read
+
+        if "Salas:" in label:
+            rooms = tuple(_ROOMS_XPATH(row))
+        elif "Observações:" in label:
+            observations = _utils.element_string(cells[1])
+        
+        if rooms != None and observations != None: # Nothing else to look for
+            break
     
     return {
         "curricular unit" : curricular_unit,
@@ -1,12 +1,14 @@
 import datetime as _datetime
 import functools as _functools
+import itertools as _itertools
 import re as _re
 
-import bs4 as _bs4
+from lxml import etree as _etree
 
 from . import _Credentials
 from . import _CurricularUnit
 from . import _Teacher
+from . import _internal_utils as _utils
 
 __all__ = ["parse_current_timetable", "parse_timetables", "parse_timetable"]
 
@@ -18,6 +20,27 @@ _weekdays_pt = ("Segunda", "Terça", "Quarta",
 
 _weekdays_pt_to_en = {pt: en for pt, en in zip(_weekdays_pt, _weekdays)}
 
+_whitespace_classes = frozenset(("horas", "almoco")) # The classes of the timetable cells that don't have events
+
+_weekday_index = {weekday: i for i, weekday in enumerate(_weekdays)} # Instead of _weekdays.index(weekday)
+
+# The times of the timetables' rows, which are 30 minutes apart and start at 8:00 (the extra ones are for the events that end at the last row)
+_row_times = tuple(_datetime.time((8 + i // 2) % 24, 30 * (i % 2)) for i in range(49))
+
+
+_BASE_URL_REGEX      = _re.compile(r"^https?://sigarra\.up\.pt/\w+/\w+/")
+_WEEKS_RANGE_REGEX   = _re.compile(r"Semanas de (\d\d)-(\d\d)-(\d\d\d\d) a (\d\d)-(\d\d)-(\d\d\d\d)")
+_ACADEMIC_YEAR_REGEX = _re.compile(r"pv_ano_lectivo=(\d\d\d\d)")
+_WEEKS_QUERY_REGEX   = _re.compile(r"&p_semana_inicio=\d+&p_semana_fim=\d+$")
+_CLASS_TYPE_REGEX    = _re.compile(r"\((\w+)\)") # e.g. "(TP)"
+
+_SIDE_BAR_XPATH       = _etree.XPath('(//table[@class = "horario-semanas ecra"])[1]')
+_TIMETABLE_XPATH      = _etree.XPath("(//" + _utils.class_xpath("table", "horario") + ")[1]")
+_OVERLAPS_TABLE_XPATH = _etree.XPath("following::" + _utils.class_xpath("table", "dados") + "[1]") # The first "dados" table after the timetable
+_HREFS_XPATH          = _etree.XPath(".//a/@href", smart_strings = False)
+_OVERLAP_ROWS_XPATH   = _etree.XPath(".//" + _utils.class_xpath("tr", "d"))
+_INNER_ITEMS_XPATH    = _etree.XPath('(//div[@id = "conteudoinner"]//a)[position() > 1]') # The links of the composite pages' items (the first link isn't one of them)
+
 class CoherenceError(Exception):
     """In very rare circumstances, it may be impossible to fetch a lesson's data.
     This exception class is here to deal with that possibility.
@@ -62,11 +85,15 @@ def parse_current_timetable(credentials: _Credentials.Credentials, url: str, ign
 
     """
     
-    for (start, finish), url in _parse_side_bar(credentials, url).items():
-        if start <= _datetime.date.today() <= finish:
-            return parse_timetable(credentials, url, ignore_coherence)
-    else:
-        return None
+    today = _datetime.date.today() # Once, instead of once per week
+
+    memo = {}
+
+    for (start, finish), url in _parse_side_bar(credentials, url, memo).items():
+        if start <= today <= finish:
+            return _parse_timetable(credentials, url, ignore_coherence, memo)
+
+    return None
 
 
 def parse_timetables(credentials: _Credentials.Credentials, url: str, ignore_coherence : bool = False) -> dict:
@@ -260,45 +287,59 @@ def parse_timetables(credentials: _Credentials.Credentials, url: str, ignore_coh
                                                                     ...]
         }
     """
-    result = _parse_side_bar(credentials, url)
+    memo = {} # Shared by all the timetables, the composite pages (and the overlaps) are usually the same in every one of them
+
+    result = _parse_side_bar(credentials, url, memo)
+    credentials.get_html_async(result.values()) # Fetching all the timetables concurrently, they are parsed one by one afterwards
 
     for key in result:
-        result[key] = parse_timetable(credentials, result[key], ignore_coherence)
+        result[key] = _parse_timetable(credentials, result[key], ignore_coherence, memo)
 
     return result
 
-def _parse_side_bar(credentials: _Credentials.Credentials, url: str) -> dict:
+def _parse_side_bar(credentials: _Credentials.Credentials, url: str, memo : dict) -> dict:
     """Returns a dictionary which maps a tuple with two datetime.date objects,
-    start and finish, to a url of the corresponding timetable (string)"""
-    html = credentials.get_html(url)
-    soup = _bs4.BeautifulSoup(html, 'lxml')
+    start and finish, to a url of the corresponding timetable (string).
+    The side bar is parsed once per memo (see :func:`_parse_timetable`)"""
+    key = ("side bar", url) # Not the url itself, which is the key of the timetable of the same page
+
+    if key not in memo:
+        memo[key] = _parse_side_bar_page(credentials.get_html(url), url)
+
+    return dict(memo[key]) # A new dict, the callers are free to modify it
 
-    base_url = _re.findall(r"^https?://sigarra\.up\.pt/\w+/\w+/", url)[0]
+def _parse_side_bar_page(html: str, url: str) -> tuple:
+    """Parses the side bar of the given html as a tuple of (key, value) pairs (see :func:`_parse_side_bar`)"""
+    tree = _utils.parse_html(html)
 
-    timetables_links_table = soup.find("table", {"class": "horario-semanas ecra"})
+    base_url = _BASE_URL_REGEX.match(url).group()
 
-    if timetables_links_table == None:
-        matches = _re.findall(r"Semanas de (\d\d)-(\d\d)-(\d\d\d\d) a (\d\d)-(\d\d)-(\d\d\d\d)", html)
+    timetables_links_tables = _SIDE_BAR_XPATH(tree)
+
+    if len(timetables_links_tables) == 0:
+        # The regex is only tried where the text starts, instead of on the whole page
+        index = html.find("Semanas de ")
+        match = _WEEKS_RANGE_REGEX.match(html, index) if index != -1 else None
+
+        if match == None and index != -1: # Just in case the first "Semanas de " isn't the right one
+            match = _WEEKS_RANGE_REGEX.search(html, index)
         
-        if len(matches) == 0:
-            return {}
+        if match == None:
+            return ()
 
-        start_day, start_month, start_year, finish_day, finish_month, finish_year  = map(int, matches[0])
+        start_day, start_month, start_year, finish_day, finish_month, finish_year  = map(int, match.groups())
 
         start = _datetime.date(start_year, start_month, start_day)
         finish = _datetime.date(finish_year, finish_month, finish_day)
 
-        return {(start, finish) : url}
+        return (((start, finish), url),)
     
-    academic_year = int(_re.findall(r"pv_ano_lectivo=(\d\d\d\d)", url)[0])
+    academic_year = int(_ACADEMIC_YEAR_REGEX.search(url).group(1))
 
     # Only the rows that have links have timetables that we have to parse
-    timetable_tags = timetables_links_table.find_all("a")
+    timetable_tags = timetables_links_tables[0].iter("a")
 
-    result = {}
-    for tag in timetable_tags:
-        result[_parse_dates(tag.string, academic_year)] = base_url + tag["href"]
-    return result
+    return tuple((_parse_dates(_utils.element_string(tag), academic_year), base_url + tag.get("href")) for tag in timetable_tags)
 
 def parse_timetable(credentials: _Credentials.Credentials, url: str, ignore_coherence : bool = False) -> list:
     """Parses the events (including overlaps) of the timetable
@@ -401,164 +442,250 @@ def parse_timetable(credentials: _Credentials.Credentials, url: str, ignore_cohe
         'weekday': 'Tuesday'},
         ... ]
     """
-    try:
-        weeks_url_query = _re.findall(r"&p_semana_inicio=\d+&p_semana_fim=\d+$", url)[0]
-    except IndexError:
-        weeks_url_query = ""
+    return _parse_timetable(credentials, url, ignore_coherence, {})
 
-    base_url = _re.findall(r"^https?://sigarra\.up\.pt/\w+/\w+/", url)[0]
+def _parse_timetable(credentials: _Credentials.Credentials, url: str, ignore_coherence : bool, memo : dict) -> list:
+    """:func:`parse_timetable`, but the results of the pages that were already parsed are taken from memo,
+    a dictionary that maps their urls to their results (and which is updated by this function)"""
+    if url in memo:
+        return memo[url]
+    
+    match = _WEEKS_QUERY_REGEX.search(url)
+    weeks_url_query = match.group() if match != None else ""
+
+    base_url = _BASE_URL_REGEX.match(url).group()
 
     html = credentials.get_html(url)
-    soup = _bs4.BeautifulSoup(html, 'lxml')
+    timetables = _TIMETABLE_XPATH(_utils.parse_html(html))
 
-    timetable_soup = soup.find("table", {"class": "horario"})
+    if len(timetables) == 0:
+        raise ValueError("No timetable was found in the html")
 
-    if timetable_soup == None:
-        raise ValueError("No timetable was found in the soup")
+    timetable = timetables[0]
 
-    result = []
+    pt_base_url = credentials.base_url.replace("/en/", "/pt/") # Computed once, every event's links are relative to it
+
+    # The composite pages (of classes, rooms and teachers) that haven't been parsed yet are fetched concurrently beforehand
+    hrefs = _HREFS_XPATH(timetable)
 
-    rows = timetable_soup.find_all("tr", recursive=False)[1:]  # Ignore the header
+    composite_urls = {(pt_base_url + href).lower() for href in hrefs if "hor_geral.composto_" in href.lower()}
+    composite_urls = [composite_url for composite_url in composite_urls if composite_url not in memo]
 
-    for i, row in enumerate(rows):
-        start_time = _datetime.timedelta(hours=8, minutes=i * 30)
+    if len(composite_urls) > 0:
+        credentials.get_html_async(composite_urls)
 
-        tds = row.find_all("td", recursive=False)[1:]  # Ignore the hour
+    # The same goes for the pages of the curricular units, which are fetched through the cache instead
+    uc_hrefs = {href for href in hrefs if "ucurr_geral.ficha_uc_view" in href.lower()}
+    uc_hrefs = [uc_href for uc_href in uc_hrefs if ("curricular unit", uc_href) not in memo]
 
-        for n, td in enumerate(tds):
-            if td["class"] in (["horas"], ["almoco"]):  # It's whitespace
+    if len(uc_hrefs) > 0:
+        for uc_href, uc in zip(uc_hrefs, _CurricularUnit.CurricularUnit.from_urls(uc_hrefs)):
+            memo[("curricular unit", uc_href)] = uc
+
+    result = []
+    ongoing = tuple([0] * len(_row_times) for _ in _weekdays) # ongoing[weekday][row]: how many events started before the row and are still going on in it
+
+    # The rows and cells are walked directly, there is no need to evaluate an XPath expression for each row
+    for i, row in enumerate(_itertools.islice(timetable.iterchildren("tr"), 1, None)): # Ignore the header
+        start = _row_times[i]
+
+        for n, td in enumerate(_itertools.islice(row.iterchildren("td"), 1, None)): # Ignore the hour
+            td_class = td.get("class")
+            if td_class != None and td_class.strip() in _whitespace_classes:  # It's whitespace (a single class, one of those)
                 continue
 
             # Otherwise we have an event we need to parse
 
             # This for loop compensates n in order to reflect the actual weekday of the event
-            for event in sorted(result, key=lambda a: _weekdays.index(a["weekday"])): # sort the events by weekday
-                if event["start"] < _timedelta_to_time(start_time) < event["finish"]:
-                    if _weekdays.index(event["weekday"]) <= n:
-                        n += 1
+            # (the columns of the events that started in previous rows and are still going on are missing from this row)
+            for weekday_index, weekday_ongoing in enumerate(ongoing): # The events are checked by weekday
+                if weekday_index <= n:
+                    n += weekday_ongoing[i]
             weekday = _weekdays[n]
 
-            class_type = _re.findall(r"\((\w+)\)", str(td))[0]
+            class_type = _CLASS_TYPE_REGEX.search(td.text_content()).group(1) # Only the text, the cell doesn't need to be turned back into html
 
-            finish_time = start_time + _datetime.timedelta(minutes=int(td["rowspan"]) * 30)
+            rowspan = int(td.get("rowspan"))
+            finish = _row_times[i + rowspan]
 
-            uc_tag, classes_tag, room_tag, teachers_tag = td.find_all("a")
+            uc_tag, classes_tag, room_tag, teachers_tag = td.iter("a")
+
+            for j in range(i + 1, i + rowspan): # The rows in which this event's column will be missing
+                ongoing[n][j] += 1
 
             result.append(
                 {
                     "weekday"        : weekday,
                     "class type"     : class_type,
-                    "start"          : _timedelta_to_time(start_time),
-                    "finish"         : _timedelta_to_time(finish_time),
-                    "curricular unit": _CurricularUnit.CurricularUnit.from_a_tag(uc_tag),
-                    "classes"        : _parse_classes(credentials, classes_tag),
-                    "room"           : _parse_rooms(credentials, room_tag),
-                    "teachers"       : _parse_teachers(credentials, teachers_tag)
+                    "start"          : start,
+                    "finish"         : finish,
+                    "curricular unit": _parse_curricular_unit(uc_tag, memo),
+                    "classes"        : _parse_classes(credentials, classes_tag, memo, pt_base_url),
+                    "room"           : _parse_rooms(credentials, room_tag, memo, pt_base_url),
+                    "teachers"       : _parse_teachers(credentials, teachers_tag, memo, pt_base_url)
                 }
             )
 
-    last_table = timetable_soup.find_next("table", {"class": "dados"})
+    last_tables = _OVERLAPS_TABLE_XPATH(timetable)
 
     if "pv_turma_id" in url:
         pass 
         # There is a weird-ass bug that shows events that are perfectly fine as overlapping, which causes runaway recursion and lots of tears
         # See https://sigarra.up.pt/feup/pt/hor_geral.turmas_view?pv_ano_lectivo=2019&pv_periodos=2&pv_turma_id=209033&p_semana_inicio=20190922&p_semana_fim=20191012
         # With "pv_turma_id" in url check, we prevent this from happening. I am assuming, of course, that a class timetable never has overlaps
-    elif "Aulas Sobrepostas" in str(last_table):
-        rows = last_table("tr", {"class": "d"})
+    elif len(last_tables) > 0 and "Aulas Sobrepostas" in last_tables[0].text_content():
+        rows = _OVERLAP_ROWS_XPATH(last_tables[0])
 
+        overlaps = [] # (weekday, start, url of the timetable that has the event, once resolved) tuples
         for row in rows:
-            weekday_pt = row.find("td", {"headers": "t2"}).string
+            cells = {} # The row's cells by header, walked once instead of being searched for each header
+            for td in row.iter("td"):
+                for header in td.get("headers", "").split():
+                    cells.setdefault(header, td) # The first cell of each header is the one that counts
+
+            weekday_pt = _utils.element_string(cells["t2"])
             weekday = _weekdays_pt_to_en[weekday_pt]
 
-            hour, minute = map(int, row.find(
-                "td", {"headers": "t3"}).string.split(":"))
-            start = _datetime.time(hour=hour, minute=minute)
+            hour, _, minute = _utils.element_string(cells["t3"]).partition(":") # "HH:MM", although the hour may have a single digit
+            start = _datetime.time(hour=int(hour), minute=int(minute))
 
-            url = (base_url + row.find("td", {"headers": "t6"}).a["href"]).lower()
+            overlap_url = (base_url + cells["t6"].find(".//a").get("href")).lower()
+            
+            overlaps.append((weekday, start, overlap_url))
 
-            if "hor_geral.composto_desc" in url:
-                temp_html = credentials.get_html(url)
-                temp_soup = _bs4.BeautifulSoup(temp_html, 'lxml')
-                temp_content = temp_soup.find("div", {"id": "conteudoinner"})
-                url = (base_url + temp_content.find_all("a")[1]["href"]).lower()
-            else:
-                url+=weeks_url_query # For some odd reason, single classes' urls don't include the start and finish weeks, a bug on sigarra's side perhaps?
+        # The composite pages of the overlaps are fetched concurrently beforehand, instead of one by one
+        composite_urls = {overlap_url for _, _, overlap_url in overlaps if "hor_geral.composto_desc" in overlap_url}
 
-            for event in parse_timetable(credentials, url, ignore_coherence):
-                if event["weekday"] == weekday and event["start"] == start:
-                    result.append(event)
-                    break
+        if len(composite_urls) > 0:
+            credentials.get_html_async(composite_urls)
+
+        for k, (weekday, start, overlap_url) in enumerate(overlaps):
+            if "hor_geral.composto_desc" in overlap_url:
+                temp_html = credentials.get_html(overlap_url)
+                temp_tags = _INNER_ITEMS_XPATH(_utils.parse_html(temp_html))
+                overlap_url = (base_url + temp_tags[0].get("href")).lower()
             else:
-                if not ignore_coherence:
-                    raise CoherenceError(url, minute, hour, weekday)
+                overlap_url+=weeks_url_query # For some odd reason, single classes' urls don't include the start and finish weeks, a bug on sigarra's side perhaps?
+
+            overlaps[k] = (weekday, start, overlap_url)
+
+        # The same goes for the overlapping timetables that haven't been parsed yet
+        overlap_urls = {overlap_url for _, _, overlap_url in overlaps if overlap_url not in memo}
+
+        if len(overlap_urls) > 0:
+            credentials.get_html_async(overlap_urls)
+
+        # Each overlapping timetable is parsed once, and its events are indexed by (weekday, start)
+        indexed_events = {}
+        for weekday, start, overlap_url in overlaps:
+            if overlap_url not in indexed_events:
+                indexed_events[overlap_url] = {}
+                for event in _parse_timetable(credentials, overlap_url, ignore_coherence, memo):
+                    indexed_events[overlap_url].setdefault((event["weekday"], event["start"]), event) # The first event that matches is the one that counts
+
+            event = indexed_events[overlap_url].get((weekday, start))
+
+            if event != None:
+                result.append(dict(event)) # A copy, the event also belongs to the memoized result
+            elif not ignore_coherence:
+                raise CoherenceError(overlap_url, start.minute, start.hour, weekday)
 
     def sort_key(event): # Sort by day and then by hour
-        return (_weekdays.index(event["weekday"]), event["start"])
+        return (_weekday_index[event["weekday"]], event["start"])
+
+    result.sort(key = sort_key) # In place, result is a new list anyway
+    memo[url] = result
+    return result
+
+
+def _parse_curricular_unit(a, memo : dict):
+    # The same curricular unit shows up in many events, but its page only has to be parsed once
+    key = ("curricular unit", a.get("href")) # Not a url, so that it can't clash with the other keys of memo
+
+    if key not in memo:
+        memo[key] = _CurricularUnit.CurricularUnit.from_url(a.get("href"))
+    
+    return memo[key]
+
 
-    return sorted(result, key = sort_key)
+def _parse_teachers(credentials: _Credentials.Credentials, a, memo : dict, pt_base_url : str) -> tuple:
+    href = a.get("href")
 
+    if "func_geral.formview" in href.lower(): # A single teacher, the full url is only needed for the composite pages
+        key = ("teacher", href) # Not a url, like the keys of the curricular units
 
-def _timedelta_to_time(t: _datetime.timedelta) -> _datetime.time:
-    return (_datetime.datetime.min + t).time()
+        if key not in memo:
+            memo[key] = (_Teacher.Teacher.from_url(href),)
 
+        return memo[key]
 
-def _parse_teachers(credentials: _Credentials.Credentials, a: _bs4.Tag) -> tuple:
-    url = (credentials.base_url.replace("/en/", "/pt/") + a["href"]).lower()
+    url = (pt_base_url + href).lower()
+
+    if url in memo: # The same composite page is linked by many events
+        return memo[url]
 
     if "hor_geral.composto_doc" in url:
         html = credentials.get_html(url)
-        soup = _bs4.BeautifulSoup(html, 'lxml')
-        content = soup.find("div", {"id": "conteudoinner"})
-        teachers_tags = content.find_all("a")[1:]
-        return tuple(_Teacher.Teacher.from_a_tag(tag) for tag in teachers_tags)
-
-    elif "func_geral.formview" in url:
-        return (_Teacher.Teacher.from_a_tag(a),)
+        teachers_tags = _INNER_ITEMS_XPATH(_utils.parse_html(html))
+        memo[url] = tuple(_Teacher.Teacher.from_url(tag.get("href")) for tag in teachers_tags)
+        return memo[url]
 
     else:
         raise Exception(f"unrecognized url: {url}")
 
 
-def _parse_classes(credentials: _Credentials.Credentials, a: _bs4.Tag) -> tuple:
-    url = (credentials.base_url.replace("/en/", "/pt/") + a["href"]).lower()
+def _parse_classes(credentials: _Credentials.Credentials, a, memo : dict, pt_base_url : str) -> tuple:
+    href = a.get("href")
+
+    if "hor_geral.turmas_view" in href.lower(): # A single class, the link's text is all that is needed
+        return (_utils.element_string(a),)
+
+    url = (pt_base_url + href).lower()
+
+    if url in memo: # The same composite page is linked by many events
+        return memo[url]
 
     if "hor_geral.composto_desc" in url:
         html = credentials.get_html(url)
-        soup = _bs4.BeautifulSoup(html, 'lxml')
-        content = soup.find("div", {"id": "conteudoinner"})
-        classes_tags = content.find_all("a")[1:]
-        return tuple(sorted(tag.string for tag in classes_tags))
-
-    elif "hor_geral.turmas_view" in url:
-        return (a.string,)
+        classes_tags = _INNER_ITEMS_XPATH(_utils.parse_html(html))
+        memo[url] = tuple(sorted(_utils.element_string(tag) for tag in classes_tags))
+        return memo[url]
 
     else:
         raise Exception(f"unrecognized url: {url}")
 
 
-def _parse_rooms(credentials: _Credentials.Credentials, a: _bs4.Tag) -> tuple:
-    url = (credentials.base_url.replace("/en/", "/pt/") + a["href"]).lower()
+def _parse_rooms(credentials: _Credentials.Credentials, a, memo : dict, pt_base_url : str) -> tuple:
+    href = a.get("href")
+
+    if "instal_geral.espaco_view" in href.lower(): # A single room, the link's text is all that is needed
+        return (_utils.element_string(a),)
+
+    url = (pt_base_url + href).lower()
+
+    if url in memo: # The same composite page is linked by many events
+        return memo[url]
 
     if "hor_geral.composto_salas" in url:
         html = credentials.get_html(url)
-        soup = _bs4.BeautifulSoup(html, 'lxml')
-        content = soup.find("div", {"id": "conteudoinner"})
-        rooms_tags = content.find_all("a")[1:]
-        return tuple(tag.string for tag in rooms_tags)
-
-    elif "instal_geral.espaco_view" in url:
-        return (a.string,)
+        rooms_tags = _INNER_ITEMS_XPATH(_utils.parse_html(html))
+        memo[url] = tuple(_utils.element_string(tag) for tag in rooms_tags)
+        return memo[url]
 
     else:
         raise Exception(f"unrecognized url: {url}")
 
 
 def _parse_dates(dates_string, academic_year : int):
-    result = []
-    for date_str in dates_string.split("a"):
-        day, month = map(int, date_str.split("-"))
+    dates_string = dates_string.strip()
 
+    if len(dates_string) == 13 and dates_string[2] == dates_string[10] == "-": # "dd-mm a dd-mm", the usual case, is read by position
+        days_and_months = ((int(dates_string[0:2]), int(dates_string[3:5])), (int(dates_string[8:10]), int(dates_string[11:13])))
+    else:
+        days_and_months = (map(int, date_str.split("-")) for date_str in dates_string.split("a"))
+
+    result = []
+    for day, month in days_and_months:
         if month >= 9:  # 9 -> September
             year = academic_year
         else:
@@ -1,9 +1,56 @@
+import collections
+import threading
 import unittest
+import weakref
 from sys import argv
+from unittest import mock
+
+import requests
+
+from feupy import cache, Student, Teacher
 
 def verbosity() -> bool:
     return ('-v' in argv) or ('--verbose' in argv)
 
+class FakeSigarra(requests.adapters.BaseAdapter):
+    """A requests transport adapter that answers with the pages in its pages dictionary,
+    which maps each url to a (html, headers) tuple, instead of making web requests.
+    It answers 304 Not Modified to the conditional GETs whose ETag matches the page's"""
+    def __init__(self, pages : dict):
+        super().__init__()
+        self.pages = pages
+        self.requests = [] # The requests sent so far, in order
+        self._lock = threading.Lock() # get_html_async sends the requests from several threads
+
+    def send(self, request, **kwargs):
+        with self._lock:
+            self.requests.append(request)
+        
+        html, headers = self.pages[request.url]
+
+        response = requests.Response()
+        response.url = request.url
+        response.request = request
+        response.encoding = "utf-8"
+        response.headers.update(headers)
+
+        if "ETag" in headers and request.headers.get("If-None-Match") == headers["ETag"]:
+            response.status_code = 304
+            response._content = b""
+        else:
+            response.status_code = 200
+            response._content = html.encode("utf-8")
+        
+        return response
+
+    def close(self):
+        pass
+
+    def urls(self) -> list:
+        """Returns the urls requested so far, in order"""
+        with self._lock:
+            return [request.url for request in self.requests]
+
 class FeupyTestCase(unittest.TestCase):
     """This class is unittest.TestCase plus a few utility methods, pretty much
     """
@@ -16,6 +63,35 @@ class FeupyTestCase(unittest.TestCase):
             if verbosity():
                 print(f"Testing attribute '{key}'")
             self.assertEqual(getattr(test_object, key), test_vars[key])
+
+    def useFakeSigarra(self, pages : dict) -> FakeSigarra:
+        """Makes the cache fetch the pages from a :obj:`FakeSigarra` instead of sigarra, until the end of the test.
+        The cache (and the live Student and Teacher objects) start empty and are restored afterwards.
+        Returns the :obj:`FakeSigarra`, so that the requests it got can be checked"""
+        sigarra = FakeSigarra(pages)
+
+        session = requests.Session()
+        session.mount("https://", sigarra)
+
+        for target, attribute, value in ((cache, "_session", session),
+                                         (cache, "cache", {cache._FORMAT_VERSION_KEY : cache._FORMAT_VERSION}),
+                                         (cache, "_hot_entries", collections.OrderedDict()),
+                                         (cache, "_timeouts", {}),
+                                         (Student, "_instances", weakref.WeakValueDictionary()),
+                                         (Student, "_missing_students", set()),
+                                         (Teacher, "_instances", weakref.WeakValueDictionary()),
+                                         (Teacher, "_missing_teachers", set())):
+            patcher = mock.patch.object(target, attribute, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        
+        return sigarra
+
+    def expireCacheEntry(self, url : str) -> None:
+        """Makes the cache entry of the url outdated, as if its timeout had passed"""
+        cache.cache[url] = (0,) + cache.cache[url][1:]
+        cache._hot_entries.pop(url, None)
+        cache._timeouts.pop(url, None)
     
     
 
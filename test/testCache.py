@@ -0,0 +1,76 @@
+import unittest
+from unittest import mock
+
+from .FeupyTestCase import FeupyTestCase
+from feupy import cache
+
+PAGE_URL = "https://sigarra.up.pt/feup/en/web_page.inicial"
+PAGE_HTML = "<html><body><p>Não tem permissões para aceder a este conteúdo.</p><script>var x = 1;</script></body></html>"
+VALIDATORS = {"ETag" : '"abc"', "Last-Modified" : "Wed, 21 Oct 2015 07:28:00 GMT"}
+
+class TestConditionalRequests(FeupyTestCase):
+    def setUp(self):
+        self.sigarra = self.useFakeSigarra({PAGE_URL : (PAGE_HTML, VALIDATORS)})
+        self.html = cache.get_html(PAGE_URL)
+        self.expireCacheEntry(PAGE_URL)
+
+    def test_treatment(self):
+        self.assertIn("Não tem permissões", self.html)
+        self.assertNotIn("script", self.html)
+
+    def test_validators_are_sent(self):
+        cache.get_html(PAGE_URL)
+
+        request = self.sigarra.requests[-1]
+        self.assertEqual(request.headers["If-None-Match"], VALIDATORS["ETag"])
+        self.assertEqual(request.headers["If-Modified-Since"], VALIDATORS["Last-Modified"])
+
+    def test_not_modified_keeps_the_html(self):
+        self.assertEqual(cache.get_html(PAGE_URL), self.html)
+        self.assertEqual(cache.cache[PAGE_URL][4], 1) # Unchanged once
+
+        cache.get_html(PAGE_URL) # Valid again, so it's not requested
+        self.assertEqual(len(self.sigarra.requests), 2)
+
+    def test_not_modified_keeps_the_html_async(self):
+        self.assertEqual(list(cache.get_html_async([PAGE_URL])), [self.html])
+        self.assertEqual(cache.cache[PAGE_URL][4], 1)
+        self.assertEqual(len(self.sigarra.requests), 2)
+
+    def test_modified_page(self):
+        self.sigarra.pages[PAGE_URL] = ("<html><body><p>Olá</p></body></html>", {"ETag" : '"def"'})
+
+        self.assertIn("Olá", cache.get_html(PAGE_URL))
+        self.assertEqual(cache.cache[PAGE_URL][2:], ('"def"', None, 0))
+
+class TestHotEntries(FeupyTestCase):
+    def setUp(self):
+        self.urls = [f"{PAGE_URL}?page={page}" for page in range(3)]
+        self.sigarra = self.useFakeSigarra({url : (PAGE_HTML, {}) for url in self.urls})
+
+    @mock.patch.object(cache, "_HOT_ENTRIES_MAX", 2)
+    def test_least_recently_used_entry_is_evicted(self):
+        for url in self.urls:
+            cache.get_html(url)
+        
+        self.assertEqual(list(cache._hot_entries), self.urls[1:])
+
+        cache.get_html(self.urls[1]) # Now the most recently used
+        self.assertEqual(list(cache._hot_entries), [self.urls[2], self.urls[1]])
+
+    @mock.patch.object(cache, "_HOT_ENTRIES_MAX", 2)
+    def test_evicted_entry_is_read_from_the_cache(self):
+        htmls = [cache.get_html(url) for url in self.urls]
+
+        self.assertEqual(cache.get_html(self.urls[0]), htmls[0])
+        self.assertEqual(len(self.sigarra.requests), 3) # It was still valid on disk
+        self.assertEqual(list(cache._hot_entries), [self.urls[2], self.urls[0]])
+
+    def test_each_url_is_fetched_once(self):
+        htmls = list(cache.get_html_async(self.urls * 2))
+
+        self.assertEqual(htmls, htmls[:3] * 2)
+        self.assertEqual(sorted(self.sigarra.urls()), sorted(self.urls))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,3 +1,4 @@
+import pickle
 import unittest
 from datetime import datetime
 
@@ -36,6 +37,10 @@ class TestFpro(FeupyTestCase):
         
         self.assertObjectAttributes(self.fpro, expected_output)
 
+    def test_pickle(self):
+        fpro = pickle.loads(pickle.dumps(self.fpro))
+        self.assertEqual(vars(fpro), vars(self.fpro))
+
 
 class TestIope(FeupyTestCase):
     @classmethod
@@ -231,5 +236,23 @@ class TestTimetableException(FeupyTestCase):
         
         self.uc.all_timetables(creds, True) # This shouldn't fail
 
+class TestBulk(FeupyTestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.ucs = CurricularUnit.bulk((419983, 436840))
+
+    def test_attributes(self):
+        self.assertEqual(tuple(uc.pv_ocorrencia_id for uc in self.ucs), (419983, 436840))
+        self.assertEqual(vars(self.ucs[0]), vars(CurricularUnit(419983)))
+
+    def test_from_urls(self):
+        ucs = CurricularUnit.from_urls(uc.url for uc in self.ucs)
+        self.assertEqual(ucs, self.ucs)
+        self.assertEqual([vars(uc) for uc in ucs], [vars(uc) for uc in self.ucs])
+
+    def test_no_cache(self):
+        ucs = CurricularUnit.bulk((419983, 436840), use_cache = False)
+        self.assertEqual([vars(uc) for uc in ucs], [vars(uc) for uc in self.ucs])
+
 if __name__ == '__main__':
     unittest.main()
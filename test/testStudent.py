@@ -0,0 +1,79 @@
+import pickle
+import unittest
+
+from .FeupyTestCase import FeupyTestCase
+from feupy import Student
+
+def student_url(username : int) -> str:
+    return f"https://sigarra.up.pt/feup/en/fest_geral.cursos_list?pv_num_unico={username}"
+
+def student_page(name : str) -> str:
+    return f"""<html><body><div id="conteudo-extra">
+        <div class="estudante-info-nome">{name}</div>
+        <div class="estudante-info-numero">201806185</div>
+        <div><a href="https://example.com/{name}">{name}'s page</a></div>
+        <div class="pagina-pessoal"><a href="https://example.com/{name}">{name}'s page</a></div>
+    </div></body></html>"""
+
+# These tests don't make web requests, sigarra is faked (see FeupyTestCase.useFakeSigarra)
+class TestStudentOffline(FeupyTestCase):
+    def setUp(self):
+        self.sigarra = self.useFakeSigarra({
+            student_url(1) : (student_page("Ana"), {}),
+            student_url(2) : (student_page("Rui"), {}),
+            student_url(3) : ("<html><body><p>Estudante não encontrado.</p></body></html>", {})
+        })
+
+    def test_attributes(self):
+        expected_output = {
+            'name': 'Ana',
+            'links': ('https://example.com/Ana', 'https://example.com/Ana'),
+            'personal_webpage': 'https://example.com/Ana',
+            'username': 1,
+            'courses': (),
+            'url': student_url(1),
+            'base_url': 'https://sigarra.up.pt/feup/en/'
+        }
+
+        self.assertObjectAttributes(Student(1), expected_output)
+
+    def test_bulk(self):
+        students = Student.bulk((2, 1))
+
+        self.assertEqual(tuple(student.name for student in students), ("Rui", "Ana"))
+        self.assertEqual(sorted(self.sigarra.urls()), [student_url(1), student_url(2)])
+
+    def test_reuse(self):
+        ana = Student(1)
+
+        self.assertIs(Student(1), ana)
+        self.assertIs(Student.bulk((1,))[0], ana)
+        self.assertEqual(len(self.sigarra.requests), 1)
+
+    def test_no_cache(self):
+        ana = Student(1)
+        self.sigarra.pages[student_url(1)] = (student_page("Eva"), {})
+
+        self.assertIsNot(Student(1, use_cache = False), ana)
+        self.assertEqual(Student.bulk((1,), use_cache = False)[0].name, "Eva")
+        self.assertEqual(Student(1).name, "Eva")
+
+    def test_pickle(self):
+        ana = Student(1)
+        unpickled = pickle.loads(pickle.dumps(ana))
+
+        self.assertEqual(vars(unpickled), vars(ana))
+
+    def test_missing_student(self):
+        for _ in range(2):
+            with self.assertRaises(ValueError):
+                Student(3)
+        
+        self.assertEqual(len(self.sigarra.requests), 1)
+
+        self.sigarra.pages[student_url(3)] = (student_page("Rita"), {})
+        self.assertEqual(Student(3, use_cache = False).name, "Rita")
+        self.assertEqual(Student(3).name, "Rita")
+
+if __name__ == '__main__':
+    unittest.main()
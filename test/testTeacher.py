@@ -0,0 +1,97 @@
+import pickle
+import unittest
+
+from .FeupyTestCase import FeupyTestCase
+from feupy import Teacher
+
+def teacher_url(p_codigo : int) -> str:
+    return f"https://sigarra.up.pt/feup/en/func_geral.formview?p_codigo={p_codigo}"
+
+def redirection_url(p_codigo : int) -> str:
+    return f"https://sigarra.up.pt/feup/en/vld_entidades_geral.entidade_pagina?pct_codigo={p_codigo}"
+
+def teacher_page(name : str, acronym : str) -> str:
+    return f"""<html><body><div id="conteudo">
+        <div class="informacao-pessoal-dados-dados"><table>
+            <tr><td>Name:</td><td><b>{name}</b></td></tr>
+            <tr><td>Acronym:</td><td>{acronym}</td></tr>
+            <tr><td>Status:</td><td>Active</td></tr>
+        </table></div>
+        <table class="tabelasz"><tr><td><a href="https://example.com/{acronym}">{acronym}</a></td></tr></table>
+        <div class="informacao-pessoal-funcoes"><table><tr><td class="topo">Department:<table>
+            <tr><td>Category:</td><td>Professor</td></tr>
+            <tr><td>Department:</td><td> Informatics Engineering </td></tr>
+        </table></td></tr></table></div>
+        <div class="informacao-pessoal-apresentacao"> Hello </div>
+    </div></body></html>"""
+
+MISSING_TEACHER_PAGE = "<html><body><p>O funcionário indicado não foi encontrado.</p></body></html>"
+
+# These tests don't make web requests, sigarra is faked (see FeupyTestCase.useFakeSigarra)
+class TestTeacherOffline(FeupyTestCase):
+    def setUp(self):
+        self.sigarra = self.useFakeSigarra({
+            teacher_url(1) : (teacher_page("Ana Silva", "AAS"), {}),
+            teacher_url(2) : (teacher_page("Rui Costa", "RCO"), {}),
+            teacher_url(3) : (MISSING_TEACHER_PAGE, {}),
+            redirection_url(3) : ("<html><body></body></html>", {})
+        })
+
+    def test_attributes(self):
+        expected_output = {
+            'name': 'Ana Silva',
+            'acronym': 'AAS',
+            'status': 'Active',
+            'links': ('https://example.com/AAS',),
+            'p_codigo': 1,
+            'url': teacher_url(1),
+            'base_url': 'https://sigarra.up.pt/feup/en/',
+            'category': 'Professor',
+            'department': 'Informatics Engineering',
+            'career': None,
+            'presentation': 'Hello'
+        }
+
+        self.assertObjectAttributes(Teacher(1), expected_output)
+
+    def test_bulk(self):
+        teachers = Teacher.bulk((2, 1))
+
+        self.assertEqual(tuple(teacher.acronym for teacher in teachers), ("RCO", "AAS"))
+        self.assertEqual(sorted(self.sigarra.urls()), [teacher_url(1), teacher_url(2)])
+
+    def test_reuse(self):
+        ana = Teacher(1)
+
+        self.assertIs(Teacher(1), ana)
+        self.assertIs(Teacher.bulk((1,))[0], ana)
+        self.assertEqual(len(self.sigarra.requests), 1)
+
+    def test_no_cache(self):
+        ana = Teacher(1)
+        self.sigarra.pages[teacher_url(1)] = (teacher_page("Ana Sousa", "AAS"), {})
+
+        self.assertIsNot(Teacher(1, use_cache = False), ana)
+        self.assertEqual(Teacher.bulk((1,), use_cache = False)[0].name, "Ana Sousa")
+        self.assertEqual(Teacher(1).name, "Ana Sousa")
+
+    def test_pickle(self):
+        ana = Teacher(1)
+        unpickled = pickle.loads(pickle.dumps(ana))
+
+        self.assertEqual(vars(unpickled), vars(ana))
+        self.assertEqual(unpickled.department, 'Informatics Engineering')
+
+    def test_missing_teacher(self):
+        for _ in range(2):
+            with self.assertRaises(ValueError):
+                Teacher(3)
+        
+        self.assertEqual(len(self.sigarra.requests), 2) # The teacher page and the redirection page
+
+        self.sigarra.pages[teacher_url(3)] = (teacher_page("Rita Alves", "RAL"), {})
+        self.assertEqual(Teacher(3, use_cache = False).name, "Rita Alves")
+        self.assertEqual(Teacher(3).name, "Rita Alves")
+
+if __name__ == '__main__':
+    unittest.main()